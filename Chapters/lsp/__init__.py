@@ -0,0 +1,5 @@
+"""Helpers shared by the chapters of Learning Statistics with Python.
+
+The chapters are run from the Chapters/ directory, so the modules in this
+package can be imported directly, e.g. ``from lsp.data import load``.
+"""
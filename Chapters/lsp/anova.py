@@ -0,0 +1,312 @@
+"""Analysis of variance from group sums.
+
+The groups are turned into integer codes once, after which the group sizes
+and group sums are single ``np.bincount`` calls. Nothing loops over the
+groups or the observations in Python, so the cost grows linearly with the
+number of observations.
+
+For factorial designs, ``CellMeans`` keeps the count, mean and sum of
+squared deviations of every combination of the factors. The marginal
+means, the grand mean and the sums of squares of all main effects and
+interactions are worked out from those few numbers, so the raw rows are
+only read once, and can even be read a chunk at a time:
+
+>>> cells = factorial(df, dv='mood_gain', between=['drug', 'therapy'])
+>>> cells.margins()        # cell, row, column and grand means
+>>> cells.anova()          # like pingouin.anova(..., detailed=True)
+"""
+
+from collections import namedtuple
+from functools import reduce
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from lsp.regression import Design
+
+SS_TYPES = (1, 2, 3)
+
+OnewayResult = namedtuple('OnewayResult', [
+    'means', 'ss_between', 'ss_within', 'df_between', 'df_within',
+    'F', 'p', 'eta2'])
+
+
+def group_codes(df, between):
+    """Integer codes for the groups in column `between`, and their labels.
+
+    Rows with a missing group get the code -1.
+    """
+    codes, labels = pd.factorize(df[between], sort=True)
+    return codes, labels
+
+
+def oneway_ss(df, dv, between):
+    """One-way ANOVA of `dv` by the groups in `between`.
+
+    Returns an ``OnewayResult`` with the group means (a Series indexed by
+    group), the between- and within-group sums of squares and degrees of
+    freedom, F, its p-value, and eta squared. Rows where either column is
+    missing are left out.
+
+    >>> oneway_ss(df, dv='mood_gain', between='drug').F
+    """
+    codes, labels = group_codes(df, between)
+    y = df[dv].to_numpy(dtype=float)
+    keep = (codes >= 0) & ~np.isnan(y)
+    codes, y = codes[keep], y[keep]
+
+    k = len(labels)
+    n = np.bincount(codes, minlength=k)
+    means = np.bincount(codes, weights=y, minlength=k) / np.maximum(n, 1)
+    grand_mean = y.mean()
+
+    ss_between = np.sum(n * (means - grand_mean) ** 2)
+    ss_within = np.sum((y - means[codes]) ** 2)
+    df_between = int(np.count_nonzero(n)) - 1
+    df_within = len(y) - int(np.count_nonzero(n))
+    F = (ss_between / df_between) / (ss_within / df_within)
+    p = stats.f.sf(F, df_between, df_within)
+    eta2 = ss_between / (ss_between + ss_within)
+
+    means = pd.Series(means, index=pd.Index(labels, name=between), name=dv)
+    return OnewayResult(means[n > 0], ss_between, ss_within, df_between,
+                        df_within, F, p, eta2)
+
+
+class CellMeans:
+    """Count, mean and sum of squared deviations in each cell of a design.
+
+    The cells are every combination of the levels of the factors in
+    `between`; the arrays ``n``, ``mean`` and ``m2`` have one axis per
+    factor, and ``levels`` holds the labels along each axis. Rows with a
+    missing value in `dv` or in any factor are left out.
+    """
+
+    def __init__(self, dv, between):
+        if isinstance(between, str):
+            between = [between]
+        self.dv = dv
+        self.factors = list(between)
+        self.levels = [pd.Index([], name=f) for f in self.factors]
+        shape = (0,) * len(self.factors)
+        self.n = np.zeros(shape, dtype=np.int64)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+
+    @classmethod
+    def from_frame(cls, df, dv, between):
+        """The cells of one data frame."""
+        cells = cls(dv, between)
+        codes, levels = zip(*(group_codes(df, f) for f in cells.factors))
+        y = df[dv].to_numpy(dtype=float)
+        keep = ~np.isnan(y)
+        for c in codes:
+            keep &= c >= 0
+        shape = tuple(len(labels) for labels in levels)
+        cell = np.ravel_multi_index([c[keep] for c in codes], shape)
+        y = y[keep]
+
+        size = int(np.prod(shape))
+        n = np.bincount(cell, minlength=size)
+        mean = np.bincount(cell, weights=y, minlength=size) / np.maximum(n, 1)
+        m2 = np.bincount(cell, weights=(y - mean[cell]) ** 2, minlength=size)
+        cells.levels = [pd.Index(labels, name=f)
+                        for labels, f in zip(levels, cells.factors)]
+        cells.n, cells.mean, cells.m2 = (a.reshape(shape) for a in (n, mean, m2))
+        return cells
+
+    def _aligned(self, levels):
+        """``n``, ``mean`` and ``m2`` laid out on the (larger) `levels`."""
+        shape = tuple(len(labels) for labels in levels)
+        where = np.ix_(*(new.get_indexer(old)
+                         for new, old in zip(levels, self.levels)))
+        arrays = []
+        for a in (self.n, self.mean, self.m2):
+            b = np.zeros(shape, dtype=a.dtype)
+            b[where] = a
+            arrays.append(b)
+        return arrays
+
+    def update(self, df):
+        """Add a chunk of rows. Returns self, so calls can be chained."""
+        return self.merge(CellMeans.from_frame(df, self.dv, self.factors))
+
+    def merge(self, other):
+        """Add the rows summarized by another ``CellMeans``, in place.
+
+        Levels that only one of the two has seen are added to the other.
+        """
+        if other.factors != self.factors:
+            raise ValueError('Cannot merge cells of %s with cells of %s'
+                             % (other.factors, self.factors))
+        levels = [a.union(b) for a, b in zip(self.levels, other.levels)]
+        na, mean_a, m2a = self._aligned(levels)
+        nb, mean_b, m2b = other._aligned(levels)
+        n = na + nb
+        delta = mean_b - mean_a
+        with np.errstate(invalid='ignore', divide='ignore'):
+            share = np.where(n > 0, nb / n, 0)
+        self.levels = levels
+        self.n = n
+        self.mean = mean_a + delta * share
+        self.m2 = m2a + m2b + delta ** 2 * na * share
+        return self
+
+    def __add__(self, other):
+        return CellMeans(self.dv, self.factors).merge(self).merge(other)
+
+    @property
+    def balanced(self):
+        """Whether every cell has the same, non-zero, number of rows."""
+        return self.n.size > 0 and self.n.min() == self.n.max() > 0
+
+    @property
+    def grand_mean(self):
+        return float(np.sum(self.n * self.mean) / self.n.sum())
+
+    def means(self):
+        """The mean of every cell, as a Series indexed by the factors."""
+        index = pd.MultiIndex.from_product(self.levels)
+        return pd.Series(self.mean.ravel(), index=index,
+                         name=self.dv)[self.n.ravel() > 0]
+
+    def marginal_means(self, factor):
+        """The mean of `dv` at each level of `factor`, over all the others."""
+        axis = self.factors.index(factor)
+        others = tuple(a for a in range(self.n.ndim) if a != axis)
+        n = self.n.sum(axis=others)
+        sums = np.sum(self.n * self.mean, axis=others)
+        return pd.Series(sums / n, index=self.levels[axis],
+                         name=self.dv)[n > 0]
+
+    def margins(self):
+        """The cell means of a two-factor design as a table, with the
+        marginal means in an extra row and column and the grand mean in
+        the corner, as ``pd.pivot_table(..., margins=True)`` would show."""
+        if len(self.factors) != 2:
+            raise ValueError('margins needs two factors, not %d'
+                             % len(self.factors))
+        rows, columns = self.factors
+        table = pd.DataFrame(np.where(self.n > 0, self.mean, np.nan),
+                             index=self.levels[0], columns=self.levels[1])
+        table['All'] = self.marginal_means(rows)
+        table.loc['All'] = pd.concat([self.marginal_means(columns),
+                                      pd.Series({'All': self.grand_mean})])
+        return table
+
+    def _terms(self):
+        """Main effects, then two-way interactions and so on, as tuples of
+        axes, in the order that ``statsmodels`` and ``pingouin`` use."""
+        axes = range(len(self.factors))
+        return [term for order in range(1, len(self.factors) + 1)
+                for term in combinations(axes, order)]
+
+    def _balanced_ss(self, terms):
+        """Sums of squares of a balanced design, from the cell means.
+
+        The effect of a term is the table of means over its factors with
+        the mean along each of those factors taken out in turn, e.g.
+        ``mean_ab - mean_a - mean_b + grand_mean`` for an interaction.
+        Each of its entries stands for the same number of rows.
+        """
+        total = self.n.sum()
+        ss = []
+        for term in terms:
+            others = tuple(a for a in range(self.n.ndim) if a not in term)
+            effect = self.mean.mean(axis=others)
+            for axis in range(effect.ndim):
+                effect = effect - effect.mean(axis=axis, keepdims=True)
+            ss.append(total * np.mean(effect ** 2))
+        return ss
+
+    def _least_squares_ss(self, terms, ss_type):
+        """Sums of squares from regressions on the cell means.
+
+        Each factor is coded with sum-to-zero contrasts and each
+        interaction with the products of the codes of its factors. Every
+        cell is one row, weighted by its count, which gives the same
+        coefficients and the same differences in residual sums of squares
+        as regressing on the rows themselves. All the models share the
+        decomposition of one ``Design``.
+        """
+        if not self.n.all():
+            raise ValueError('Every combination of %s needs at least one '
+                             'observation' % self.factors)
+        weight = np.sqrt(self.n.ravel())
+        cell = np.indices(self.n.shape).reshape(self.n.ndim, -1)
+        codes = [np.vstack([np.eye(len(labels) - 1),
+                            -np.ones(len(labels) - 1)])[cell[axis]]
+                 for axis, labels in enumerate(self.levels)]
+
+        columns = {'Intercept': weight}
+        names = {}
+        for term in terms:
+            product = reduce(lambda a, b: (a[:, :, None] * b[:, None, :])
+                             .reshape(len(weight), -1),
+                             (codes[axis] for axis in term))
+            name = ':'.join(self.factors[axis] for axis in term)
+            names[term] = ['%s[%d]' % (name, j)
+                           for j in range(product.shape[1])]
+            columns.update(zip(names[term], (weight[:, None] * product).T))
+        design = Design(pd.DataFrame(columns), list(columns), intercept=False)
+        y = weight * self.mean.ravel()
+
+        def rss(model):
+            return design.rss(y, ['Intercept'] + [name for term in model
+                                                  for name in names[term]])
+
+        ss = []
+        for i, term in enumerate(terms):
+            if ss_type == 1:
+                model = terms[:i]
+            elif ss_type == 2:
+                model = [t for t in terms if not set(term) <= set(t)]
+            else:
+                model = [t for t in terms if t != term]
+            ss.append(rss(model) - rss(model + [term]))
+        return ss
+
+    def anova(self, ss_type=2):
+        """ANOVA table of all main effects and interactions.
+
+        `ss_type` picks Type I (sequential), II or III sums of squares,
+        which only differ when the design is unbalanced; the default is
+        Type II, as in ``pingouin.anova``. Balanced designs are worked out
+        directly from the cell means and the others by least squares.
+        Returns a DataFrame like ``pingouin.anova(..., detailed=True)``,
+        with SS, DF, MS, F, p and partial eta squared (``np2``) for each
+        term and the residuals.
+        """
+        if ss_type not in SS_TYPES:
+            raise ValueError('ss_type must be one of %s' % (SS_TYPES,))
+        terms = self._terms()
+        if self.balanced:
+            ss = self._balanced_ss(terms)
+        else:
+            ss = self._least_squares_ss(terms, ss_type)
+        dof = [int(np.prod([len(self.levels[axis]) - 1 for axis in term]))
+               for term in terms]
+        ss_resid = self.m2.sum()
+        df_resid = int(self.n.sum()) - int(np.count_nonzero(self.n))
+
+        ss, dof = np.array(ss), np.array(dof)
+        ms_resid = ss_resid / df_resid
+        F = ss / dof / ms_resid
+        table = pd.DataFrame({
+            'SS': ss, 'DF': dof, 'MS': ss / dof, 'F': F,
+            'p': stats.f.sf(F, dof, df_resid), 'np2': ss / (ss + ss_resid)},
+            index=[' * '.join(self.factors[axis] for axis in term)
+                   for term in terms])
+        table.loc['Residual'] = [ss_resid, df_resid, ms_resid,
+                                 np.nan, np.nan, np.nan]
+        table['DF'] = table['DF'].astype(int)
+        table.index.name = 'Source'
+        return table
+
+
+def factorial(df, dv, between):
+    """The ``CellMeans`` of `dv` in every combination of the factors in
+    `between`, counted with a single ``np.bincount``."""
+    return CellMeans.from_frame(df, dv, between)
@@ -0,0 +1,233 @@
+"""Checks of the assumptions behind t-tests and ANOVA, all at once.
+
+``check_assumptions`` takes the residuals of a one-way model (each value
+minus the mean of its group), sorts them once, and works out from them
+
+* Levene's test and the Brown-Forsythe test of equal variances, which are
+  one-way ANOVAs of the absolute deviations from the group means and the
+  group medians (the medians come straight from the sorted residuals);
+* Bartlett's test of equal variances, from the group variances;
+* the Shapiro-Wilk test of normality, whose coefficients are built from
+  the expected normal order statistics, which are also the theoretical
+  quantiles of the QQ plot;
+* D'Agostino's K-squared test of normality, from the skewness and
+  kurtosis;
+* the coordinates of the QQ plot.
+
+>>> checks = check_assumptions(df, dv='mood_gain', between='drug')
+>>> checks.tests
+>>> sns.scatterplot(data=checks.qq, x='theoretical', y='sample')
+
+The normality tests also work on many samples of the same size at once,
+one per row of a 2-D array, sharing the Shapiro-Wilk coefficients:
+
+>>> normality(residuals)
+"""
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from lsp.anova import group_codes
+
+AssumptionChecks = namedtuple('AssumptionChecks', ['tests', 'residuals', 'qq'])
+
+# Polynomial approximations of Royston (1995), "Remark AS R94", as used by
+# scipy.stats.shapiro, for the largest coefficients and for the mean and
+# log standard deviation of the normalized W
+_SW_C1 = [0.0, 0.221157, -0.147981, -2.071190, 4.434685, -2.706056]
+_SW_C2 = [0.0, 0.042981, -0.293762, -1.752461, 5.682633, -3.582633]
+_SW_C3 = [0.5440, -0.39978, 0.025054, -6.714e-4]
+_SW_C4 = [1.3822, -0.77857, 0.062767, -0.0020322]
+_SW_C5 = [-1.5861, -0.31082, -0.083751, 0.0038915]
+_SW_C6 = [-0.4803, -0.082676, 0.0030302]
+_SW_GAMMA = [-2.273, 0.459]
+
+
+def normal_scores(n):
+    """Approximate expected values of the order statistics of `n` standard
+    normal values (Blom's ``(i - 3/8) / (n + 1/4)`` plotting positions)."""
+    return stats.norm.ppf((np.arange(1, n + 1) - 0.375) / (n + 0.25))
+
+
+def _shapiro_coefficients(m):
+    n = len(m)
+    if n == 3:
+        return np.sqrt(0.5) * np.array([-1.0, 0.0, 1.0])
+    poly = np.polynomial.polynomial.polyval
+    u = 1 / np.sqrt(n)
+    ssq = np.sum(m ** 2)
+    a = m / np.sqrt(ssq)
+    a_n = a[-1] + poly(u, _SW_C1)
+    if n > 5:
+        a_n1 = a[-2] + poly(u, _SW_C2)
+        phi = (ssq - 2 * m[-1] ** 2 - 2 * m[-2] ** 2) / (1 - 2 * a_n ** 2
+                                                         - 2 * a_n1 ** 2)
+        a = m / np.sqrt(phi)
+        a[[0, 1, -2, -1]] = -a_n, -a_n1, a_n1, a_n
+    else:
+        phi = (ssq - 2 * m[-1] ** 2) / (1 - 2 * a_n ** 2)
+        a = m / np.sqrt(phi)
+        a[[0, -1]] = -a_n, a_n
+    return a
+
+
+def _shapiro(x, m):
+    """Shapiro-Wilk W and p along the rows of the sorted array `x`, given
+    the ``normal_scores`` `m` of its row length."""
+    n = x.shape[-1]
+    if n < 3:
+        return np.full(x.shape[:-1], np.nan), np.full(x.shape[:-1], np.nan)
+    a = _shapiro_coefficients(m)
+    ss = np.sum((x - x.mean(axis=-1, keepdims=True)) ** 2, axis=-1)
+    W = np.minimum((x @ a) ** 2 / ss, 1)
+
+    poly = np.polynomial.polynomial.polyval
+    if n == 3:
+        p = np.maximum(6 / np.pi * (np.arcsin(np.sqrt(W))
+                                    - np.arcsin(np.sqrt(0.75))), 0)
+        return W, p
+    with np.errstate(divide='ignore', invalid='ignore'):
+        y = np.log1p(-W)
+        if n <= 11:
+            gamma = poly(n, _SW_GAMMA)
+            y = -np.log(gamma - y)
+            mean, sd = poly(n, _SW_C3), np.exp(poly(n, _SW_C4))
+        else:
+            mean, sd = poly(np.log(n), _SW_C5), np.exp(poly(np.log(n), _SW_C6))
+        p = stats.norm.sf((y - mean) / sd)
+    return W, p
+
+
+def _dagostino(x):
+    """D'Agostino and Pearson's K-squared and p along the rows of `x`, as
+    ``scipy.stats.normaltest``, from the second to fourth central moments."""
+    n = x.shape[-1]
+    d = x - x.mean(axis=-1, keepdims=True)
+    d2 = d * d
+    m2 = d2.mean(axis=-1)
+    skew = (d2 * d).mean(axis=-1) / m2 ** 1.5
+    kurtosis = (d2 * d2).mean(axis=-1) / m2 ** 2
+    if n < 8:
+        return np.full(skew.shape, np.nan), np.full(skew.shape, np.nan)
+
+    # Skewness test
+    y = skew * np.sqrt((n + 1) * (n + 3) / (6.0 * (n - 2)))
+    beta2 = (3.0 * (n * n + 27 * n - 70) * (n + 1) * (n + 3)
+             / ((n - 2.0) * (n + 5) * (n + 7) * (n + 9)))
+    w2 = -1 + np.sqrt(2 * (beta2 - 1))
+    delta = 1 / np.sqrt(0.5 * np.log(w2))
+    alpha = np.sqrt(2.0 / (w2 - 1))
+    y = np.where(y == 0, 1, y)
+    z_skew = delta * np.log(y / alpha + np.sqrt((y / alpha) ** 2 + 1))
+
+    # Kurtosis test
+    expected = 3.0 * (n - 1) / (n + 1)
+    var = (24.0 * n * (n - 2) * (n - 3)
+           / ((n + 1) * (n + 1.0) * (n + 3) * (n + 5)))
+    k = (kurtosis - expected) / np.sqrt(var)
+    root_beta1 = (6.0 * (n * n - 5 * n + 2) / ((n + 7) * (n + 9))
+                  * np.sqrt(6.0 * (n + 3) * (n + 5) / (n * (n - 2) * (n - 3))))
+    A = 6.0 + 8.0 / root_beta1 * (2.0 / root_beta1
+                                  + np.sqrt(1 + 4.0 / root_beta1 ** 2))
+    denom = 1 + k * np.sqrt(2 / (A - 4.0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        term = np.sign(denom) * np.where(
+            denom == 0, np.nan, ((1 - 2.0 / A) / np.abs(denom)) ** (1 / 3))
+    z_kurtosis = (1 - 2 / (9.0 * A) - term) / np.sqrt(2 / (9.0 * A))
+
+    K2 = z_skew ** 2 + z_kurtosis ** 2
+    return K2, stats.chi2.sf(K2, 2)
+
+
+def normality(x):
+    """Shapiro-Wilk and D'Agostino tests of each row of `x`.
+
+    `x` is one sample, or a 2-D array with one sample per row, all of the
+    same size and without missing values. The Shapiro-Wilk coefficients
+    only depend on the sample size, so they are computed once for all
+    rows. Returns a DataFrame with one row per sample.
+    """
+    x = np.sort(np.atleast_2d(np.asarray(x, dtype=float)), axis=-1)
+    W, p_shapiro = _shapiro(x, normal_scores(x.shape[-1]))
+    K2, p_dagostino = _dagostino(x)
+    return pd.DataFrame({'shapiro_W': W, 'shapiro_p': p_shapiro,
+                         'dagostino_K2': K2, 'dagostino_p': p_dagostino})
+
+
+def _oneway_F(z, codes, n):
+    """F and p of a one-way ANOVA of `z` on the groups in `codes`."""
+    k, total = len(n), len(z)
+    means = np.bincount(codes, weights=z, minlength=k) / n
+    ss_between = np.sum(n * (means - z.mean()) ** 2)
+    ss_within = np.sum((z - means[codes]) ** 2)
+    F = (ss_between / (k - 1)) / (ss_within / (total - k))
+    return F, stats.f.sf(F, k - 1, total - k)
+
+
+def check_assumptions(df, dv, between=None):
+    """Tests of equal variances and of normality for a one-way design.
+
+    The residuals are `dv` minus the mean of its group in `between` (or
+    minus the overall mean, without `between`, in which case only the
+    normality tests are run). Rows with a missing value are left out.
+
+    Returns ``AssumptionChecks`` with
+
+    * ``tests``: a DataFrame with the statistic, its degrees of freedom
+      and the p-value of Levene's test (centred on the mean), the
+      Brown-Forsythe test (centred on the median, which is what
+      ``pingouin.homoscedasticity`` does by default), Bartlett's test, the
+      Shapiro-Wilk test and D'Agostino's test;
+    * ``residuals``: a Series with the index of `df`;
+    * ``qq``: the theoretical normal quantiles and the sorted residuals.
+    """
+    y = df[dv].to_numpy(dtype=float)
+    if between is None:
+        codes, k = np.zeros(len(df), dtype=int), 1
+    else:
+        codes, labels = group_codes(df, between)
+        k = len(labels)
+    keep = (codes >= 0) & ~np.isnan(y)
+    codes, y, index = codes[keep], y[keep], df.index[keep]
+    total = len(y)
+
+    n = np.bincount(codes, minlength=k)
+    residuals = y - (np.bincount(codes, weights=y, minlength=k) / n)[codes]
+
+    # One sort of the residuals; a stable sort of the group codes in that
+    # order then puts each group's residuals together, still sorted
+    order = np.argsort(residuals)
+    ordered = residuals[order]
+    grouped = residuals[order[np.argsort(codes[order], kind='stable')]]
+    start = np.cumsum(n) - n
+    medians = (grouped[start + (n - 1) // 2] + grouped[start + n // 2]) / 2
+
+    m = normal_scores(total)
+    W, p_shapiro = _shapiro(ordered, m)
+    K2, p_dagostino = _dagostino(ordered)
+    rows = {'shapiro': (W, np.nan, np.nan, p_shapiro),
+            'dagostino': (K2, 2, np.nan, p_dagostino)}
+    if k > 1:
+        levene = _oneway_F(np.abs(residuals), codes, n)
+        brown_forsythe = _oneway_F(np.abs(residuals - medians[codes]),
+                                   codes, n)
+        var = np.bincount(codes, weights=residuals ** 2, minlength=k) / (n - 1)
+        pooled = np.sum((n - 1) * var) / (total - k)
+        bartlett = ((total - k) * np.log(pooled)
+                    - np.sum((n - 1) * np.log(var))) / (
+            1 + (np.sum(1 / (n - 1)) - 1 / (total - k)) / (3 * (k - 1)))
+        rows = {'levene': (levene[0], k - 1, total - k, levene[1]),
+                'brown_forsythe': (brown_forsythe[0], k - 1, total - k,
+                                   brown_forsythe[1]),
+                'bartlett': (bartlett, k - 1, np.nan,
+                             stats.chi2.sf(bartlett, k - 1)),
+                **rows}
+
+    tests = pd.DataFrame.from_dict(
+        rows, orient='index', columns=['statistic', 'dof1', 'dof2', 'p'])
+    qq = pd.DataFrame({'theoretical': m, 'sample': ordered})
+    return AssumptionChecks(tests, pd.Series(residuals, index=index, name=dv),
+                            qq)
@@ -0,0 +1,141 @@
+"""Bootstrap confidence intervals.
+
+The bootstrap estimates the sampling distribution of a statistic by
+recomputing it on many resamples of the data, drawn with replacement.
+Resamples are drawn as a ``(rows, n)`` array of indices, a block at a time
+so that memory use stays bounded, and the statistic is computed along the
+rows, so it must accept an ``axis`` argument like the numpy functions do.
+Statistics can also be given by name:
+
+>>> bootstrap(margins, 'median', seed=1)
+>>> bootstrap((parenthood['dan_sleep'], parenthood['dan_grump']),
+...           'correlation', method='percentile')
+
+With ``jobs > 1`` the resamples are shared out over worker processes, each
+with its own independent random stream, so the statistic must then be a
+name or a function defined at the top level of a module.
+"""
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import stats
+
+from lsp.rng import seed_sequence
+from lsp.sampling import BLOCK_SIZE, STATISTICS
+
+BootstrapResult = namedtuple('BootstrapResult', [
+    'estimate', 'ci_low', 'ci_high', 'se', 'distribution'])
+
+METHODS = ('percentile', 'basic', 'bca')
+
+
+def trimmed_mean(x, axis=-1, proportion=0.1):
+    """Mean after cutting `proportion` of the values off each end."""
+    return stats.trim_mean(x, proportion, axis=axis)
+
+
+def correlation(x, y, axis=-1):
+    """Pearson correlation between `x` and `y` along `axis`."""
+    x = x - x.mean(axis=axis, keepdims=True)
+    y = y - y.mean(axis=axis, keepdims=True)
+    return (np.sum(x * y, axis=axis)
+            / np.sqrt(np.sum(x * x, axis=axis) * np.sum(y * y, axis=axis)))
+
+
+def _statistic(statistic):
+    if isinstance(statistic, str):
+        if statistic == 'trimmed_mean':
+            return trimmed_mean
+        if statistic == 'correlation':
+            return correlation
+        return STATISTICS[statistic]
+    return statistic
+
+
+def _samples(data):
+    """The data as a tuple of equally long 1-D arrays."""
+    if isinstance(data, tuple):
+        samples = tuple(np.asarray(x, dtype=float) for x in data)
+    else:
+        samples = (np.asarray(data, dtype=float),)
+    if len({len(x) for x in samples}) != 1:
+        raise ValueError('All samples must have the same length')
+    return samples
+
+
+def _replicates(samples, statistic, B, seed):
+    """The statistic on `B` resamples of the rows of `samples`."""
+    statistic = _statistic(statistic)
+    rng = np.random.default_rng(seed)
+    n = len(samples[0])
+    rows = max(1, BLOCK_SIZE // n)
+    results = []
+    for start in range(0, B, rows):
+        index = rng.integers(0, n, size=(min(rows, B - start), n))
+        results.append(statistic(*(x[index] for x in samples), axis=-1))
+    return np.concatenate(results)
+
+
+def _jackknife(samples, statistic):
+    """The statistic with each observation left out in turn."""
+    n = len(samples[0])
+    rows = max(1, BLOCK_SIZE // n)
+    results = []
+    for start in range(0, n, rows):
+        # Row i of `index` is 0..n-1 without i, for the i in this block
+        left_out = np.arange(start, min(start + rows, n))[:, None]
+        index = np.arange(1, n) - (np.arange(n - 1) < left_out)
+        results.append(statistic(*(x[index] for x in samples), axis=-1))
+    return np.concatenate(results)
+
+
+def _bca_levels(samples, statistic, estimate, distribution, alpha):
+    """Adjusted percentile levels for the BCa interval."""
+    z0 = stats.norm.ppf(np.mean(distribution < estimate))
+    jack = _jackknife(samples, statistic)
+    d = jack.mean() - jack
+    a = np.sum(d ** 3) / (6 * np.sum(d ** 2) ** 1.5)
+    z = stats.norm.ppf(alpha)
+    return stats.norm.cdf(z0 + (z0 + z) / (1 - a * (z0 + z)))
+
+
+def bootstrap(data, statistic, B=10000, method='bca', confidence=0.95,
+              seed=None, jobs=1):
+    """Bootstrap confidence interval for `statistic` computed on `data`.
+
+    `data` is an array, or a tuple of arrays whose rows are resampled
+    together (for a correlation, say). `statistic` is one of the names in
+    ``sampling.STATISTICS``, ``'trimmed_mean'`` or ``'correlation'``, or a
+    function called as ``statistic(*samples, axis=-1)``. `method` is
+    ``'percentile'``, ``'basic'`` or ``'bca'`` (bias corrected and
+    accelerated). `seed` is anything ``lsp.rng.seed_sequence`` accepts.
+
+    Returns a ``BootstrapResult`` with the statistic on the data, the
+    interval, the bootstrap standard error and the `B` bootstrapped values.
+    """
+    if method not in METHODS:
+        raise ValueError('method must be one of %s' % (METHODS,))
+    samples = _samples(data)
+    function = _statistic(statistic)
+    estimate = function(*samples, axis=-1)
+
+    seed = seed_sequence(seed)
+    if jobs == 1:
+        distribution = _replicates(samples, statistic, B, seed)
+    else:
+        shares = [B // jobs + (i < B % jobs) for i in range(jobs)]
+        with ProcessPoolExecutor(jobs) as pool:
+            distribution = np.concatenate(list(pool.map(
+                _replicates, [samples] * jobs, [statistic] * jobs, shares,
+                seed.spawn(jobs))))
+
+    alpha = np.array([(1 - confidence) / 2, (1 + confidence) / 2])
+    if method == 'bca':
+        alpha = _bca_levels(samples, function, estimate, distribution, alpha)
+    low, high = np.quantile(distribution, alpha)
+    if method == 'basic':
+        low, high = 2 * estimate - high, 2 * estimate - low
+    return BootstrapResult(estimate, low, high, distribution.std(ddof=1),
+                           distribution)
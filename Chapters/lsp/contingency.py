@@ -0,0 +1,174 @@
+"""Contingency tables that are counted once and then remembered.
+
+``crosstab(df, 'choice', 'species')`` turns both columns into integer codes
+and counts every combination with a single ``np.bincount``. Everything else
+(the margins, proportions, expected counts and test statistics) is worked
+out from those counts the first time it is asked for and kept on the table:
+
+>>> table = crosstab(df, index='choice', columns='species')
+>>> table.margins          # like pd.crosstab(..., margins=True)
+>>> table.chi2.p
+"""
+
+from collections import namedtuple
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from lsp.anova import group_codes
+
+Chi2Result = namedtuple('Chi2Result', ['chi2', 'dof', 'p'])
+FisherResult = namedtuple('FisherResult', ['odds_ratio', 'p'])
+McNemarResult = namedtuple('McNemarResult', ['chi2', 'dof', 'p', 'p_exact'])
+
+
+class ContingencyTable:
+    """Counts of every combination of the row and column categories.
+
+    `counts` is a 2-D array and `index` and `columns` the labels of its rows
+    and columns, each a ``pd.Index`` whose name is the variable name.
+    """
+
+    def __init__(self, counts, index, columns):
+        self.counts = np.asarray(counts)
+        self.index = index
+        self.columns = columns
+
+    @classmethod
+    def from_codes(cls, row_codes, col_codes, index, columns):
+        """Count pairs of integer codes; pairs with a code of -1 are left out."""
+        r, c = len(index), len(columns)
+        keep = (row_codes >= 0) & (col_codes >= 0)
+        cells = row_codes[keep] * c + col_codes[keep]
+        counts = np.bincount(cells, minlength=r * c).reshape(r, c)
+        return cls(counts, index, columns)
+
+    def _frame(self, values):
+        return pd.DataFrame(values, index=self.index, columns=self.columns)
+
+    @cached_property
+    def n(self):
+        return int(self.counts.sum())
+
+    @cached_property
+    def observed(self):
+        """The counts as a DataFrame, like ``pd.crosstab``."""
+        return self._frame(self.counts)
+
+    @cached_property
+    def row_totals(self):
+        return pd.Series(self.counts.sum(axis=1), index=self.index)
+
+    @cached_property
+    def col_totals(self):
+        return pd.Series(self.counts.sum(axis=0), index=self.columns)
+
+    @cached_property
+    def margins(self):
+        """The counts with an ``All`` row and column of totals, like
+        ``pd.crosstab(..., margins=True)``."""
+        table = self.observed.copy()
+        table.index = table.index.astype(object)
+        table.columns = table.columns.astype(object)
+        table['All'] = self.row_totals.to_numpy()
+        table.loc['All'] = np.append(self.col_totals.to_numpy(), self.n)
+        return table
+
+    @cached_property
+    def proportions(self):
+        """Each count as a proportion of the total."""
+        return self._frame(self.counts / self.n)
+
+    @cached_property
+    def row_proportions(self):
+        """Each count as a proportion of its row total."""
+        return self._frame(self.counts / self.row_totals.to_numpy()[:, None])
+
+    @cached_property
+    def col_proportions(self):
+        """Each count as a proportion of its column total."""
+        return self._frame(self.counts / self.col_totals.to_numpy())
+
+    @cached_property
+    def expected(self):
+        """Expected counts if rows and columns were independent."""
+        return self._frame(np.outer(self.row_totals, self.col_totals) / self.n)
+
+    def _check_margins(self):
+        # Expected counts of zero would make the chi-square statistic NaN
+        empty = list(self.index[self.counts.sum(axis=1) == 0])
+        empty += list(self.columns[self.counts.sum(axis=0) == 0])
+        if empty:
+            raise ValueError('Every row and column of the table needs a '
+                             'count, but these are empty: %s'
+                             % ', '.join(map(str, empty)))
+
+    @cached_property
+    def chi2(self):
+        """Pearson's chi-square test of independence.
+
+        As in ``scipy.stats.chi2_contingency``, the Yates continuity
+        correction is applied when there is one degree of freedom. Rows
+        or columns without any counts raise a ``ValueError``.
+        """
+        self._check_margins()
+        observed = self.counts
+        expected = self.expected.to_numpy()
+        dof = (observed.shape[0] - 1) * (observed.shape[1] - 1)
+        deviation = np.abs(observed - expected)
+        if dof == 1:
+            deviation = np.maximum(deviation - 0.5, 0)
+        chi2 = np.sum(deviation ** 2 / expected)
+        return Chi2Result(chi2, dof, stats.chi2.sf(chi2, dof))
+
+    @cached_property
+    def cramers_v(self):
+        """Cramer's V, computed from the uncorrected chi-square statistic."""
+        self._check_margins()
+        expected = self.expected.to_numpy()
+        chi2 = np.sum((self.counts - expected) ** 2 / expected)
+        return np.sqrt(chi2 / (self.n * (min(self.counts.shape) - 1)))
+
+    def _check_2x2(self, test):
+        if self.counts.shape != (2, 2):
+            raise ValueError('The %s test needs a 2 x 2 table, not %d x %d'
+                             % ((test,) + self.counts.shape))
+
+    @cached_property
+    def fisher(self):
+        """Fisher's exact test (two-sided) for a 2 x 2 table."""
+        self._check_2x2('Fisher exact')
+        return FisherResult(*stats.fisher_exact(self.counts))
+
+    @cached_property
+    def mcnemar(self):
+        """McNemar's test for a 2 x 2 table of paired responses.
+
+        ``chi2`` and ``p`` use the continuity correction, ``p_exact`` is the
+        exact binomial p-value, as in ``pingouin.chi2_mcnemar``. Without
+        any discordant pairs the statistic is 0 and both p-values are 1,
+        as in ``statsmodels``.
+        """
+        self._check_2x2('McNemar')
+        b, c = self.counts[0, 1], self.counts[1, 0]
+        if b + c == 0:
+            return McNemarResult(0.0, 1, 1.0, 1.0)
+        chi2 = (abs(b - c) - 1) ** 2 / (b + c)
+        p_exact = min(1.0, 2 * stats.binom.cdf(min(b, c), b + c, 0.5))
+        return McNemarResult(chi2, 1, stats.chi2.sf(chi2, 1), p_exact)
+
+
+def crosstab(df, index, columns):
+    """Cross-tabulate two columns of `df` into a ``ContingencyTable``.
+
+    The categories are sorted (or kept in their declared order for
+    categorical columns), and rows with a missing value in either column
+    are left out, as ``pd.crosstab`` does.
+    """
+    row_codes, row_labels = group_codes(df, index)
+    col_codes, col_labels = group_codes(df, columns)
+    return ContingencyTable.from_codes(
+        row_codes, col_codes,
+        pd.Index(row_labels, name=index), pd.Index(col_labels, name=columns))
@@ -0,0 +1,98 @@
+"""Correlation matrices, with p-values and confidence intervals.
+
+``correlation_matrix`` correlates every column of a DataFrame with every
+other one using matrix products, so that a table with thousands of columns
+takes a few BLAS calls rather than millions of pairwise loops:
+
+>>> corr = correlation_matrix(parenthood2)
+>>> corr.r, corr.n, corr.p
+
+Missing values are handled pairwise, like ``DataFrame.corr`` does: each
+pair of columns uses all the rows where both are present. With ``M`` the
+0/1 matrix of present values and ``X`` the data with missing values set to
+0, ``M'M`` counts the rows that each pair shares, ``X'M`` sums each column
+over the rows it shares with each other column, ``(X*X)'M`` does the same
+for the squares, and ``X'X`` holds the cross products. Without missing
+values the standardized columns are multiplied just once.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from lsp.posthoc import adjust
+from lsp.ranks import rankdata
+
+CorrelationResult = namedtuple('CorrelationResult', [
+    'r', 'n', 'p', 'ci_low', 'ci_high'])
+
+METHODS = ('pearson', 'spearman')
+
+
+def _pearson(X):
+    """Correlations and pair counts of the columns of `X` (which may have
+    NaN)."""
+    present = ~np.isnan(X)
+    # Centring first keeps the sums of squares from cancelling out
+    X = X - np.nanmean(X, axis=0)
+    if present.all():
+        n = np.full((X.shape[1],) * 2, float(len(X)))
+        Z = X / np.sqrt(np.sum(X * X, axis=0))
+        return Z.T @ Z, n
+
+    M = present.astype(float)
+    X = np.where(present, X, 0)
+    n = M.T @ M
+    sums = X.T @ M               # sums[i, j]: column i where j is present
+    squares = (X * X).T @ M
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = X.T @ X - sums * sums.T / n
+        var = squares - sums ** 2 / n
+        r = cov / np.sqrt(var * var.T)
+    return r, n
+
+
+def correlation_matrix(df, method='pearson', confidence=0.95,
+                       padjust='none'):
+    """Correlations between all the numeric columns of `df`.
+
+    `method` is ``'pearson'`` or ``'spearman'``. Spearman correlations are
+    Pearson correlations of the ranks, and each column is ranked once; with
+    missing values this is over all of the column's values, where pandas
+    ranks each pair of columns again over just their shared rows, so the
+    two can differ a little.
+
+    Returns a ``CorrelationResult`` of DataFrames: the correlations, the
+    number of rows used for each pair, the p-values of the t-test that the
+    correlation is zero (adjusted for the number of pairs with `padjust`,
+    see ``lsp.posthoc.adjust``), and confidence intervals from Fisher's z
+    transformation, as in ``pingouin.corr``. The diagonal has no p-value.
+    """
+    if method not in METHODS:
+        raise ValueError('method must be one of %s' % (METHODS,))
+    df = df.select_dtypes('number')
+    X = df.to_numpy(dtype=float)
+    if method == 'spearman':
+        X = rankdata(X.T)[0].T
+    r, n = _pearson(X)
+    r = np.clip(r, -1, 1)
+    np.fill_diagonal(r, 1)
+
+    dof = n - 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        T = r * np.sqrt(dof / ((1 - r) * (1 + r)))
+        p = 2 * stats.t.sf(np.abs(T), dof)
+        z = np.arctanh(r)
+        margin = stats.norm.ppf(0.5 + confidence / 2) / np.sqrt(n - 3)
+    upper = np.triu_indices(len(r), k=1)
+    p[upper] = adjust(p[upper], padjust)
+    p.T[upper] = p[upper]
+    np.fill_diagonal(p, np.nan)
+
+    def frame(values):
+        return pd.DataFrame(values, index=df.columns, columns=df.columns)
+    return CorrelationResult(frame(r), frame(n.astype(int)), frame(p),
+                             frame(np.tanh(z - margin)),
+                             frame(np.tanh(z + margin)))
@@ -0,0 +1,272 @@
+"""Access to the datasets used in the book.
+
+``load("zeppo")`` looks for ``zeppo.csv`` in the Data/ directory of this
+repository first. If it is not there (for instance when a notebook has been
+downloaded on its own), the file is fetched from the book's GitHub
+repository and kept in a local cache, so it is only downloaded once.
+
+Set the environment variable ``LSP_OFFLINE=1`` to never touch the network,
+and ``LSP_CACHE_DIR`` to change where downloaded files are kept.
+
+Parsed datasets are also kept in memory, so loading the same file again in
+a later cell does not parse it again. ``cache_info()`` reports how often
+that happened.
+
+Every dataset in Data/ has a declared schema in ``SCHEMAS``, so that e.g.
+``drug`` and ``therapy`` come back as categoricals. Running
+``python -m lsp.data`` from the Chapters/ directory writes a Feather copy
+of each file to Data/.mirror/, which ``load`` reads instead of the CSV for
+as long as it is newer than both the CSV and this module. Without pyarrow
+the CSV files are used.
+"""
+
+import os
+import sys
+import hashlib
+import tempfile
+import urllib.request
+from collections import OrderedDict, namedtuple
+from pathlib import Path
+
+import pandas as pd
+
+DATA_DIR = Path(__file__).resolve().parents[2] / 'Data'
+REMOTE_URL = 'https://raw.githubusercontent.com/ethanweed/pythonbook/main/Data/'
+CACHE_DIR = Path(os.environ.get('LSP_CACHE_DIR',
+                                Path.home() / '.cache' / 'pythonbook'))
+MIRROR_DIR = DATA_DIR / '.mirror'
+MAX_FRAMES = 32
+
+# Text columns are 'str', which is pandas' own string dtype from pandas 3
+# on (and object before), so that the CSV and the Feather mirror agree
+SCHEMAS = {
+    'afl2small': {'margin': 'int64', 'year': 'int64'},
+    'afl_finalists': {'afl.finalists': 'category'},
+    'afl_margins': {'afl.margins': 'int64'},
+    'agpp': {'id': 'str', 'response_before': 'category',
+             'response_after': 'category'},
+    'awesome': {'scores': 'float64', 'group': 'category'},
+    'awesome2': {'score_A': 'float64', 'score_B': 'float64'},
+    'berkeley': {'women.apply': 'int64', 'total.admit': 'int64',
+                 'number.apply': 'int64'},
+    'berkeley2': {'women.apply': 'int64', 'total.admit': 'int64',
+                  'number.apply': 'int64', 'depart.size': 'category'},
+    'berkeley_small': {'women.apply': 'int64', 'total.admit': 'int64'},
+    'booksales': {'Month': 'str', 'Days': 'int64', 'Sales': 'int64',
+                  'Stock.Levels': 'category'},
+    'cakes': {'time.1': 'int64', 'time.2': 'int64', 'time.3': 'int64',
+              'time.4': 'int64', 'time.5': 'int64'},
+    'cards': {'id': 'str', 'choice_1': 'category', 'choice_2': 'category'},
+    'chapek9': {'species': 'category', 'choice': 'category'},
+    'chico': {'id': 'str', 'grade_test1': 'float64',
+              'grade_test2': 'float64'},
+    'clinical_trial_data': {'drug': 'category', 'therapy': 'category',
+                            'mood_gain': 'float64'},
+    'clintrial': {'drug': 'category', 'therapy': 'category',
+                  'mood_gain': 'float64'},
+    'cordata': {'%s%s' % (v, suffix): 'float64'
+                for suffix in ['', '.1', '.2', '.3', '.4', '.5', '.6', '.7']
+                for v in ['V1', 'V2']},
+    'drugs': {'id': 'int64', 'gender': 'category', 'WMC_alcohol': 'float64',
+              'WMC_caffeine': 'float64', 'WMC_no.drug': 'float64',
+              'RT_alcohol': 'int64', 'RT_caffeine': 'int64',
+              'RT_no.drug': 'int64'},
+    'drugs1': {'id': 'int64', 'gender': 'category', 'alcohol': 'float64',
+               'caffeine': 'float64', 'no.drug': 'float64'},
+    'effort': {'hours': 'int64', 'grade': 'int64'},
+    'happiness': {'before': 'int64', 'after': 'int64', 'change': 'int64'},
+    'harpo': {'grade': 'int64', 'tutor': 'category'},
+    'heavy_tailed_data': {'data': 'float64'},
+    # the unnamed first column holds R's row names
+    'kurtosisdata_ncurve': {'Unnamed: 0': 'int64', 'x': 'float64',
+                            'y': 'float64'},
+    # parenthood2 has missing values, so its grumpiness scores are floats
+    'parenthood': {'dan_sleep': 'float64', 'baby_sleep': 'float64',
+                   'dan_grump': 'int64', 'day': 'int64'},
+    'parenthood2': {'dan_sleep': 'float64', 'baby_sleep': 'float64',
+                    'dan_grump': 'float64', 'day': 'int64'},
+    'salem': {'happy': 'bool', 'on.fire': 'bool'},
+    'skewed_data': {'data': 'float64'},
+    'zeppo': {'grades': 'int64'},
+}
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+_frames = OrderedDict()
+_hits = 0
+_misses = 0
+
+
+def offline():
+    """True if datasets may not be downloaded."""
+    return os.environ.get('LSP_OFFLINE', '') not in ('', '0')
+
+
+def _filename(name):
+    return name if name.endswith('.csv') else name + '.csv'
+
+
+def _cached_path(url):
+    # Keep the readable file name, but include a hash of the URL so that
+    # files with the same name from different places do not collide
+    digest = hashlib.sha256(url.encode()).hexdigest()[:16]
+    return CACHE_DIR / (digest + '-' + url.rsplit('/', 1)[-1])
+
+
+def _download(url, path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Download to a temporary file first, so that an interrupted download
+    # never leaves a truncated file in the cache
+    fd, tmp = tempfile.mkstemp(dir=path.parent)
+    try:
+        with os.fdopen(fd, 'wb') as f, urllib.request.urlopen(url) as r:
+            f.write(r.read())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _stem(name):
+    return name[:-len('.csv')] if name.endswith('.csv') else name
+
+
+def path(name):
+    """Return the local path of a dataset, downloading it if necessary.
+
+    `name` is either the name of a file in Data/, with or without the
+    ``.csv`` extension, or a full URL.
+    """
+    if '://' in name:
+        url = name
+    else:
+        local = DATA_DIR / _filename(name)
+        if local.exists():
+            return local
+        url = REMOTE_URL + _filename(name)
+
+    cached = _cached_path(url)
+    if not cached.exists():
+        if offline():
+            raise FileNotFoundError(
+                '%s is not available locally and LSP_OFFLINE is set' % name)
+        _download(url, cached)
+    return cached
+
+
+def _mirror_path(name):
+    """The Feather copy of a dataset in Data/, if it is usable and fresh."""
+    if '://' in name or _stem(name) not in SCHEMAS:
+        return None
+    csv = DATA_DIR / _filename(name)
+    mirror = MIRROR_DIR / (_stem(name) + '.feather')
+    try:
+        import pyarrow  # noqa: F401
+        fresh_after = max(csv.stat().st_mtime, Path(__file__).stat().st_mtime)
+        if mirror.stat().st_mtime >= fresh_after:
+            return mirror
+    except (ImportError, OSError):
+        pass
+    return None
+
+
+def _read(p, name, kwargs):
+    if p.suffix == '.feather':
+        return pd.read_feather(p)
+    if 'dtype' not in kwargs and _stem(name) in SCHEMAS:
+        kwargs = dict(kwargs, dtype=SCHEMAS[_stem(name)])
+    return pd.read_csv(p, **kwargs)
+
+
+def mirror(names=None):
+    """Write a Feather copy of each dataset in Data/ using its schema.
+
+    Each copy is read back and must have the same dtypes as the CSV, so
+    that ``load`` returns the same frame either way. Returns the paths
+    written. Requires pyarrow.
+    """
+    if names is None:
+        names = sorted(SCHEMAS)
+    MIRROR_DIR.mkdir(exist_ok=True)
+    written = []
+    for name in names:
+        target = MIRROR_DIR / (_stem(name) + '.feather')
+        frame = _read(DATA_DIR / _filename(name), name, {})
+        frame.to_feather(target)
+        copy = _read(target, name, {})
+        if not copy.dtypes.equals(frame.dtypes):
+            target.unlink()
+            raise TypeError('The Feather copy of %s has dtypes %s, not %s'
+                            % (name, dict(copy.dtypes), dict(frame.dtypes)))
+        written.append(target)
+    return written
+
+
+def _copy_on_write():
+    if int(pd.__version__.split('.')[0]) >= 3:
+        return True
+    try:
+        return pd.get_option('mode.copy_on_write') is True
+    except KeyError:
+        return False
+
+
+def load(name, **kwargs):
+    """Read a dataset into a pandas DataFrame.
+
+    Datasets in Data/ are read with their declared schema, from the Feather
+    mirror if there is a fresh one. Extra keyword arguments are passed on to
+    ``pd.read_csv``, and always make ``load`` read the CSV file. The parsed
+    frame is remembered, keyed on the file and its modification time, and
+    every call returns a copy of it, so changing the returned frame never
+    affects later calls. With pandas' copy-on-write mode switched on the
+    copy is free until one of the two is modified.
+
+    >>> df = load("zeppo")
+    """
+    global _hits, _misses
+    p = None if kwargs else _mirror_path(name)
+    if p is None:
+        p = path(name)
+    key = (str(p), p.stat().st_mtime_ns, repr(sorted(kwargs.items())))
+    if key in _frames:
+        _hits += 1
+        _frames.move_to_end(key)
+    else:
+        _misses += 1
+        _frames[key] = _read(p, name, kwargs)
+        if len(_frames) > MAX_FRAMES:
+            _frames.popitem(last=False)
+    return _frames[key].copy(deep=not _copy_on_write())
+
+
+def chunks(name, column, chunksize=100000):
+    """Read one column of a dataset as a sequence of NumPy arrays.
+
+    Only `chunksize` rows are held in memory at a time, so this works for
+    files that are too large to ``load``. See ``lsp.descriptives``.
+    """
+    reader = pd.read_csv(path(name), usecols=[column], chunksize=chunksize)
+    with reader:
+        for frame in reader:
+            yield frame[column].to_numpy(dtype=float, na_value=float('nan'))
+
+
+def cache_info():
+    """Report how many loads were answered from memory."""
+    return CacheInfo(_hits, _misses, MAX_FRAMES, len(_frames))
+
+
+def cache_clear():
+    """Forget every parsed dataset and reset the counters."""
+    global _hits, _misses
+    _frames.clear()
+    _hits = _misses = 0
+
+
+if __name__ == '__main__':
+    try:
+        for target in mirror(sys.argv[1:] or None):
+            print('Wrote', target)
+    except ImportError:
+        sys.exit('Writing the Feather mirror requires pyarrow.')
@@ -0,0 +1,313 @@
+"""Descriptive statistics computed in a single pass over chunks of data.
+
+``Moments`` keeps just the count, minimum, maximum, mean and the sums of
+squared, cubed and fourth-power deviations from the mean. Two of them can
+be merged with the pairwise formulas of Chan et al. and Pebay, so a data
+set can be summarized one chunk at a time (or in several processes) without
+ever holding all of it in memory:
+
+>>> from lsp.data import chunks
+>>> summarize(chunks('afl_margins', 'afl.margins')).to_series()
+
+Quantiles cannot be merged like that, so ``QuantileSketch`` keeps a small,
+weighted sample of the values instead (a KLL sketch), from which the median,
+quartiles and IQR can be estimated to within a known error in rank. Both
+can be filled in the same pass:
+
+>>> moments, sketch = summarize(chunks('afl_margins', 'afl.margins'),
+...                             Moments(), QuantileSketch())
+
+For data that do fit in memory, ``quantile``, ``median``, ``iqr`` and
+``mad`` give the exact answers using ``np.partition``, which only puts the
+values that are needed in place rather than sorting the whole array.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Ratio between the capacities of neighbouring levels of a QuantileSketch
+SKETCH_DECAY = 2 / 3
+
+
+class Moments:
+    """Running count, extremes and central moments of a variable.
+
+    Missing values (NaN) are counted in ``missing`` and otherwise ignored,
+    like pandas does. ``var``, ``std``, ``skew`` and ``kurtosis`` follow
+    the same conventions as the pandas methods with the same names.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.missing = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.m3 = 0.0
+        self.m4 = 0.0
+
+    @classmethod
+    def from_array(cls, x):
+        """The moments of one array of values."""
+        x = np.asarray(x, dtype=float).ravel()
+        missing = np.isnan(x)
+        x = x[~missing]
+        moments = cls()
+        moments.missing = int(missing.sum())
+        if len(x):
+            d = x - x.mean()
+            d2 = d * d
+            moments.n = len(x)
+            moments.min = x.min()
+            moments.max = x.max()
+            moments.mean = x.mean()
+            moments.m2 = d2.sum()
+            moments.m3 = (d2 * d).sum()
+            moments.m4 = (d2 * d2).sum()
+        return moments
+
+    def update(self, x):
+        """Add a chunk of values. Returns self, so calls can be chained."""
+        return self.merge(Moments.from_array(x))
+
+    def merge(self, other):
+        """Add the values summarized by another ``Moments``, in place."""
+        na, nb = self.n, other.n
+        self.missing += other.missing
+        if nb == 0:
+            return self
+        if na == 0:
+            self.__dict__.update(other.__dict__, missing=self.missing)
+            return self
+
+        n = na + nb
+        delta = other.mean - self.mean
+        delta_n = delta / n
+        m2a, m3a = self.m2, self.m3
+        m2b, m3b = other.m2, other.m3
+
+        self.m4 += (other.m4
+                    + delta * delta_n ** 3 * na * nb * (na * na - na * nb + nb * nb)
+                    + 6 * delta_n ** 2 * (na * na * m2b + nb * nb * m2a)
+                    + 4 * delta_n * (na * m3b - nb * m3a))
+        self.m3 += (m3b
+                    + delta * delta_n ** 2 * na * nb * (na - nb)
+                    + 3 * delta_n * (na * m2b - nb * m2a))
+        self.m2 += m2b + delta * delta_n * na * nb
+        self.mean += delta_n * nb
+        self.n = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def __add__(self, other):
+        return Moments().merge(self).merge(other)
+
+    def var(self, ddof=1):
+        return self.m2 / (self.n - ddof) if self.n > ddof else np.nan
+
+    def std(self, ddof=1):
+        return np.sqrt(self.var(ddof))
+
+    def skew(self, bias=False):
+        """Skewness. The default is the adjusted estimate used by pandas;
+        ``bias=True`` gives the plain estimate used by scipy."""
+        n = self.n
+        if n < 3 or self.m2 == 0:
+            return np.nan
+        g1 = np.sqrt(n) * self.m3 / self.m2 ** 1.5
+        return g1 if bias else g1 * np.sqrt(n * (n - 1)) / (n - 2)
+
+    def kurtosis(self, fisher=True, bias=False):
+        """Kurtosis, by default the adjusted excess kurtosis used by pandas.
+
+        ``fisher=False`` gives Pearson's definition (3 for a normal curve),
+        ``bias=True`` the plain estimate; see ``scipy.stats.kurtosis``.
+        """
+        n = self.n
+        if n < 4 or self.m2 == 0:
+            return np.nan
+        g2 = n * self.m4 / self.m2 ** 2 - 3
+        if not bias:
+            g2 = ((n + 1) * g2 + 6) * (n - 1) / ((n - 2) * (n - 3))
+        return g2 if fisher else g2 + 3
+
+    def to_series(self):
+        """All the summaries as a pandas Series."""
+        return pd.Series({
+            'count': self.n,
+            'missing': self.missing,
+            'mean': self.mean,
+            'var': self.var(),
+            'std': self.std(),
+            'min': self.min,
+            'max': self.max,
+            'skew': self.skew(),
+            'kurtosis': self.kurtosis(),
+        })
+
+
+class QuantileSketch:
+    """Approximate quantiles of a stream of values, in bounded memory.
+
+    The values are kept in levels, where a value in level ``h`` stands for
+    ``2 ** h`` of the original values. When the sketch grows beyond its
+    capacity, the lowest full level is sorted and every other value is
+    moved up a level. `k` sets the size of the top level: the memory used
+    grows like ``k`` plus the logarithm of the number of values, and the
+    error in the rank of an estimated quantile is typically below ``1.7 / k``
+    of the number of values (under 1% for the default ``k=200``). As long as
+    fewer than `k` values have been added the quantiles are exact.
+
+    `seed` is used for the random choice between keeping the odd or the
+    even values in a compaction.
+    """
+
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.n = 0
+        self.missing = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, h):
+        depth = len(self.levels) - h - 1
+        return max(2, int(np.ceil(self.k * SKETCH_DECAY ** depth)))
+
+    def _compress(self):
+        while sum(map(len, self.levels)) > sum(
+                self._capacity(h) for h in range(len(self.levels))):
+            h = next(h for h, level in enumerate(self.levels)
+                     if len(level) > self._capacity(h))
+            if h + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            level = np.sort(self.levels[h])
+            keep = level[len(level) - len(level) % 2:]
+            promoted = level[self._rng.integers(2):len(level) - len(keep):2]
+            self.levels[h] = keep
+            self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+
+    def update(self, x):
+        """Add a chunk of values. Returns self, so calls can be chained."""
+        x = np.asarray(x, dtype=float).ravel()
+        missing = np.isnan(x)
+        x = x[~missing]
+        self.missing += int(missing.sum())
+        if len(x):
+            self.n += len(x)
+            self.min = min(self.min, x.min())
+            self.max = max(self.max, x.max())
+            self.levels[0] = np.concatenate([self.levels[0], x])
+            self._compress()
+        return self
+
+    def merge(self, other):
+        """Add the values summarized by another ``QuantileSketch``, in place."""
+        for h, level in enumerate(other.levels):
+            if h == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[h] = np.concatenate([self.levels[h], level])
+        self.n += other.n
+        self.missing += other.missing
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def quantile(self, q):
+        """Estimate the `q` quantile(s), interpolating like ``np.quantile``
+        while the sketch is still exact."""
+        if self.n == 0:
+            return np.full(np.shape(q), np.nan)[()]
+        if len(self.levels) == 1:
+            return quantile(self.levels[0], q)
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2.0 ** h)
+                                  for h, level in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        values = values[order]
+        # Place each value at the middle of the ranks it stands for
+        ranks = np.cumsum(weights[order]) - weights[order] / 2
+        estimate = np.interp(np.asarray(q) * self.n, ranks, values)
+        return np.clip(estimate, self.min, self.max)
+
+    def median(self):
+        return self.quantile(0.5)
+
+    def iqr(self):
+        lower, upper = self.quantile([0.25, 0.75])
+        return upper - lower
+
+    def to_series(self):
+        """The five-number summary and the IQR as a pandas Series."""
+        q1, median, q3 = self.quantile([0.25, 0.5, 0.75])
+        return pd.Series({
+            'count': self.n,
+            'missing': self.missing,
+            'min': self.min,
+            '25%': q1,
+            '50%': median,
+            '75%': q3,
+            'max': self.max,
+            'iqr': q3 - q1,
+        })
+
+
+def summarize(chunks, *accumulators):
+    """Feed an iterable of arrays, in one pass, to each of `accumulators`.
+
+    Without `accumulators` the chunks are summarized by a ``Moments``, which
+    is returned. Otherwise the accumulators (anything with an ``update``
+    method) are returned, or just the one if only one was given.
+    """
+    accumulators = accumulators or (Moments(),)
+    for chunk in chunks:
+        for accumulator in accumulators:
+            accumulator.update(chunk)
+    return accumulators[0] if len(accumulators) == 1 else accumulators
+
+
+def _finite(x):
+    x = np.asarray(x, dtype=float).ravel()
+    return x[~np.isnan(x)]
+
+
+def quantile(x, q):
+    """Exact quantile(s) of `x`, the same as ``np.quantile`` with its default
+    linear interpolation but leaving out missing values.
+
+    Rather than sorting `x`, ``np.partition`` puts just the order statistics
+    that are needed in their sorted positions, which takes linear time.
+    """
+    x = _finite(x)
+    if len(x) == 0:
+        return np.full(np.shape(q), np.nan)[()]
+    position = (len(x) - 1) * np.asarray(q, dtype=float)
+    lo = np.floor(position).astype(int)
+    hi = np.minimum(lo + 1, len(x) - 1)
+    x = np.partition(x, np.unique(np.concatenate([np.ravel(lo), np.ravel(hi)])))
+    return x[lo] + (position - lo) * (x[hi] - x[lo])
+
+
+def median(x):
+    return quantile(x, 0.5)
+
+
+def iqr(x):
+    """Interquartile range, the same as ``scipy.stats.iqr``."""
+    lower, upper = quantile(x, [0.25, 0.75])
+    return upper - lower
+
+
+def mad(x, c=0.6744897501960817):
+    """Median absolute deviation from the median, divided by `c`.
+
+    The default `c` makes it estimate the standard deviation of normally
+    distributed data, like ``statsmodels.robust.mad``; use ``c=1`` for the
+    raw median absolute deviation.
+    """
+    x = _finite(x)
+    return median(np.abs(x - median(x))) / c
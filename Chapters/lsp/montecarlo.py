@@ -0,0 +1,121 @@
+"""Monte Carlo p-values for chi-square tests.
+
+The chi-square tests in scipy compare the statistic to the chi-square
+distribution, which is only an approximation and a poor one when expected
+frequencies are small. Here the p-value is instead the proportion of
+tables, simulated under the null hypothesis, whose statistic is at least as
+large as the observed one. All simulated tables of a block are drawn with
+a single call per cell and their statistics are computed as array
+operations, so a million tables take a few seconds. With ``jobs > 1`` the
+tables are shared out over worker processes, each with its own independent
+random stream. `seed` is anything ``lsp.rng.seed_sequence`` accepts.
+
+>>> independence_test(crosstab(df, 'happy', 'on.fire'), B=100000, seed=1)
+"""
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from lsp.rng import seed_sequence
+from lsp.sampling import BLOCK_SIZE
+
+MonteCarloResult = namedtuple('MonteCarloResult', ['chi2', 'p', 'B'])
+
+# Simulated statistics within this relative distance of the observed one
+# count as ties, so that rounding error does not decide the comparison
+TOLERANCE = 1e-7
+
+
+def _chi2(observed, expected):
+    return np.sum((observed - expected) ** 2 / expected, axis=-1)
+
+
+def _gof_tables(rng, size, counts, probs):
+    return rng.multinomial(counts.sum(), probs, size=size)
+
+
+def _fixed_margin_tables(rng, size, counts):
+    """Random tables with the same row and column totals as `counts`.
+
+    Each column is filled in row by row, drawing each cell from the
+    hypergeometric distribution of what is left of its row total among
+    what is left of all row totals. This gives the same distribution of
+    tables as randomly permuting one variable against the other.
+    """
+    r, c = counts.shape
+    rows_left = np.tile(counts.sum(axis=1), (size, 1))
+    tables = np.zeros((size, r, c), dtype=np.int64)
+    for j, col_total in enumerate(counts.sum(axis=0)[:-1]):
+        sample_left = np.full(size, col_total)
+        total_left = rows_left.sum(axis=1)
+        for i in range(r - 1):
+            total_left = total_left - rows_left[:, i]
+            cell = rng.hypergeometric(rows_left[:, i], total_left, sample_left)
+            tables[:, i, j] = cell
+            sample_left = sample_left - cell
+        tables[:, r - 1, j] = sample_left
+        rows_left -= tables[:, :, j]
+    tables[:, :, c - 1] = rows_left
+    return tables.reshape(size, r * c)
+
+
+def _count_extreme(draw, args, expected, threshold, B, seed):
+    """Simulate `B` tables and count those with a statistic >= `threshold`."""
+    rng = np.random.default_rng(seed)
+    rows = max(1, BLOCK_SIZE // expected.size)
+    extreme = 0
+    for start in range(0, B, rows):
+        tables = draw(rng, min(rows, B - start), *args)
+        extreme += int(np.count_nonzero(_chi2(tables, expected) >= threshold))
+    return extreme
+
+
+def _simulate(draw, args, expected, chi2, B, seed, jobs):
+    threshold = chi2 * (1 - TOLERANCE)
+    seed = seed_sequence(seed)
+    if jobs == 1:
+        extreme = _count_extreme(draw, args, expected, threshold, B, seed)
+    else:
+        shares = [B // jobs + (i < B % jobs) for i in range(jobs)]
+        with ProcessPoolExecutor(jobs) as pool:
+            extreme = sum(pool.map(_count_extreme, [draw] * jobs,
+                                   [args] * jobs, [expected] * jobs,
+                                   [threshold] * jobs, shares,
+                                   seed.spawn(jobs)))
+    return MonteCarloResult(chi2, (extreme + 1) / (B + 1), B)
+
+
+def chisquare_test(observed, f_exp=None, B=10000, seed=None, jobs=1):
+    """Goodness-of-fit test with a Monte Carlo p-value.
+
+    `observed` holds the counts of each category and `f_exp` the expected
+    counts (by default equal for all categories), as in
+    ``scipy.stats.chisquare``. The simulated tables are multinomial draws
+    with the expected proportions. The p-value counts the observed table
+    as one of the simulated ones, so it is never 0.
+    """
+    counts = np.asarray(observed, dtype=np.int64)
+    if f_exp is None:
+        f_exp = np.full(len(counts), counts.sum() / len(counts))
+    expected = np.asarray(f_exp, dtype=float)
+    probs = expected / expected.sum()
+    chi2 = _chi2(counts, expected)
+    return _simulate(_gof_tables, (counts, probs), expected, chi2,
+                     B, seed, jobs)
+
+
+def independence_test(table, B=10000, seed=None, jobs=1):
+    """Chi-square test of independence with a Monte Carlo p-value.
+
+    `table` is a ``ContingencyTable`` or a 2-D array of counts. The
+    simulated tables keep the observed row and column totals, as in
+    Fisher's exact test. No continuity correction is applied.
+    """
+    counts = np.asarray(getattr(table, 'counts', table), dtype=np.int64)
+    expected = (np.outer(counts.sum(axis=1), counts.sum(axis=0))
+                / counts.sum()).ravel()
+    chi2 = _chi2(counts.ravel(), expected)
+    return _simulate(_fixed_margin_tables, (counts,), expected, chi2,
+                     B, seed, jobs)
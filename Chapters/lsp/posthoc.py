@@ -0,0 +1,225 @@
+"""Post hoc comparisons of every pair of groups.
+
+The count, mean and variance of each group are computed once (see
+``lsp.ttest.cell_moments``), and the t statistics of all ``k(k-1)/2``
+pairs are then array operations on those, rather than a separate test on
+the raw data for each pair:
+
+>>> pairwise_ttests(df, dv='mood_gain', between='drug', padjust='holm')
+>>> pairwise_tukey(df, dv='mood_gain', between='drug')
+
+With `by`, the same comparisons are made within every level of another
+column (one experiment, or variant, per level), all in one go, and the
+p-values are adjusted within each level. ``adjust`` corrects any array of
+p-values for multiple comparisons, along its last axis.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from scipy.special import ndtr
+
+from lsp.sampling import BLOCK_SIZE
+from lsp.ttest import cell_moments, ttest_from_moments
+
+ADJUSTMENTS = ('none', 'bonf', 'holm', 'fdr_bh', 'fdr_by')
+
+
+def _panels(count, order=8):
+    """Composite Gauss-Legendre nodes and weights on [0, 1], with `order`
+    nodes on each of `count` equal panels."""
+    x, w = np.polynomial.legendre.leggauss(order)
+    start = np.arange(count)[:, None] / count
+    return ((start + (x + 1) / (2 * count)).ravel(),
+            np.tile(w / (2 * count), count))
+
+
+# Nodes and weights for the two integrals of the studentized range
+# distribution, over z and over log s, and the probability left out in
+# each tail of the distribution of s. Many short panels keep up with the
+# steep integrand of large k and the wide range of log s at small dof.
+_Z_NODES, _Z_WEIGHTS = _panels(36)
+_S_NODES, _S_WEIGHTS = _panels(96)
+_S_TAIL = 1e-15
+
+
+def adjust(p, method='holm'):
+    """Adjust the p-values along the last axis of `p` for multiple tests.
+
+    `method` is ``'bonf'`` (Bonferroni), ``'holm'``, ``'fdr_bh'``
+    (Benjamini-Hochberg false discovery rate), ``'fdr_by'``
+    (Benjamini-Yekutieli) or ``'none'``, the same names that
+    ``pingouin.multicomp`` uses. Missing p-values (NaN) are not counted
+    as tests and stay missing, as in pingouin.
+    """
+    if method not in ADJUSTMENTS:
+        raise ValueError('method must be one of %s' % (ADJUSTMENTS,))
+    p = np.asarray(p, dtype=float)
+    m = np.sum(~np.isnan(p), axis=-1, keepdims=True)
+    if method == 'none':
+        return p
+    if method == 'bonf':
+        return np.minimum(p * m, 1)
+
+    # NaN sorts last, so the first m ranked values are the tests
+    order = np.argsort(p, axis=-1)
+    ranked = np.take_along_axis(p, order, axis=-1)
+    rank = np.arange(1, p.shape[-1] + 1)
+    if method == 'holm':
+        # The j-th smallest p-value is multiplied by m - j + 1, and none
+        # may be smaller than the one before it
+        ranked = np.maximum.accumulate((m - rank + 1) * ranked, axis=-1)
+    else:
+        ranked = ranked * m / rank
+        if method == 'fdr_by':
+            ranked = ranked * np.cumsum(1 / rank)[np.maximum(m, 1) - 1]
+        # ... and none may be larger than the one after it
+        ranked = np.flip(np.fmin.accumulate(np.flip(ranked, -1), -1), -1)
+    adjusted = np.empty_like(ranked)
+    np.put_along_axis(adjusted, order, np.minimum(ranked, 1), axis=-1)
+    return adjusted
+
+
+def studentized_range_sf(q, k, dof):
+    """``scipy.stats.studentized_range.sf``, for many `q` and `dof` at once.
+
+    The range of `k` standard normal values, divided by an independent
+    estimate ``s`` of their standard deviation with `dof` degrees of
+    freedom, exceeds `q` with probability
+
+        E_s[ k * integral phi(z) (Phi(z)^(k-1) - (Phi(z) - Phi(z - q s))^(k-1)) dz ]
+
+    The integral over z in [-9, 9] and the expectation over log s are
+    done by composite Gauss-Legendre quadrature on fixed nodes, for all
+    values as one array operation (a block at a time), where scipy
+    integrates adaptively, one value at a time. For `k` from 2 to 200,
+    `dof` from 1 to 1000 and `q` from 0.01 to 60 the two differ by at most
+    2e-9, and by less than 1e-5 relative to p wherever p > 1e-8; further
+    out, scipy itself is only accurate to about 1e-13.
+    """
+    q, dof = np.broadcast_arrays(np.asarray(q, dtype=float),
+                                 np.asarray(dof, dtype=float))
+    shape = q.shape
+    q, dof = q.ravel(), dof.ravel()
+
+    z = 18 * _Z_NODES - 9
+    z_weights = 18 * _Z_WEIGHTS * stats.norm.pdf(z)
+    below = ndtr(z)
+    rows = max(1, BLOCK_SIZE // (len(_S_NODES) * len(z)))
+    sf = np.empty(len(q))
+    for start in range(0, len(q), rows):
+        block = slice(start, start + rows)
+        nu = dof[block, None]
+        # s = sqrt(chi2 / dof), between its 1e-15 and 1 - 1e-15 quantiles,
+        # at nodes evenly spread in log s
+        low = np.log(stats.chi2.ppf(_S_TAIL, nu) / nu) / 2
+        high = np.log(stats.chi2.isf(_S_TAIL, nu) / nu) / 2
+        s = np.exp(low + (high - low) * _S_NODES)
+        s_weights = ((high - low) * _S_WEIGHTS * s * np.sqrt(nu)
+                     * stats.chi.pdf(s * np.sqrt(nu), nu))
+        within = below - ndtr(z - q[block, None, None] * s[:, :, None])
+        inner = k * np.sum(z_weights * (below ** (k - 1)
+                                        - within ** (k - 1)), axis=-1)
+        sf[block] = np.sum(s_weights * inner, axis=-1)
+    return np.clip(sf, 0, 1).reshape(shape)
+
+
+def studentized_range_isf(p, k, dof, tol=1e-10):
+    """The `q` with ``studentized_range_sf(q, k, dof) == p``, by bisection
+    for all `dof` together."""
+    p, dof = np.broadcast_arrays(np.asarray(p, dtype=float),
+                                 np.asarray(dof, dtype=float))
+    low, high = np.zeros(p.shape), np.full(p.shape, 100.0)
+    # With few degrees of freedom q can be larger still
+    short = studentized_range_sf(high, k, dof) > p
+    while short.any():
+        low, high = np.where(short, high, low), np.where(short, 2 * high, high)
+        short = studentized_range_sf(high, k, dof) > p
+    while np.max(high - low) > tol:
+        middle = (low + high) / 2
+        above = studentized_range_sf(middle, k, dof) > p
+        low, high = np.where(above, middle, low), np.where(above, high, middle)
+    return (low + high) / 2
+
+
+def _pairs(df, dv, between, by):
+    """Group moments, and for every pair of groups that both have values
+    in a level of `by`: that level, the pair's position among all pairs,
+    the two groups, and the index of the result."""
+    n, mean, var, levels, groups = cell_moments(df, dv, between, by)
+    a, b = np.triu_indices(len(groups), k=1)
+    level = np.repeat(np.arange(len(levels)), len(a))
+    pair = np.tile(np.arange(len(a)), len(levels))
+    a, b = a[pair], b[pair]
+    keep = (n[level, a] > 0) & (n[level, b] > 0)
+    level, pair, a, b = level[keep], pair[keep], a[keep], b[keep]
+    arrays, names = [groups[a], groups[b]], ['A', 'B']
+    if by is not None:
+        arrays, names = [levels[level]] + arrays, [by] + names
+    index = pd.MultiIndex.from_arrays(arrays, names=names)
+    return n, mean, var, level, pair, a, b, index
+
+
+def pairwise_ttests(df, dv, between, by=None, padjust='none',
+                    equal_var=True, confidence=0.95):
+    """Independent-samples t-tests between every pair of groups of `between`.
+
+    Each pair is tested on its own, as ``pingouin.pairwise_tests`` does,
+    with Student's test or, with ``equal_var=False``, Welch's (which
+    pingouin switches to by itself when the groups differ in size). The result
+    has one row per pair (indexed by the groups ``A`` and ``B``, and by
+    the level of `by` if given), with the columns of ``lsp.ttest`` plus
+    ``p_corr``, the p-value adjusted with `padjust` (see ``adjust``).
+    Pairs with a group that has no values in a level of `by` are left
+    out, and are not counted when adjusting.
+    """
+    n, mean, var, level, pair, a, b, index = _pairs(df, dv, between, by)
+    result = ttest_from_moments(
+        n[level, a], mean[level, a], var[level, a],
+        n[level, b], mean[level, b], var[level, b],
+        equal_var, 'two-sided', confidence)
+    result.index = index
+    # One row of p-values per level, with NaN for the pairs left out
+    k = n.shape[1]
+    p = np.full((len(n), k * (k - 1) // 2), np.nan)
+    p[level, pair] = result['p'].to_numpy()
+    result['p_corr'] = adjust(p, padjust)[level, pair]
+    return result
+
+
+def pairwise_tukey(df, dv, between, by=None, confidence=0.95):
+    """Tukey's honestly significant difference test of every pair of groups.
+
+    Unlike ``pairwise_ttests``, the standard errors use the pooled
+    within-group variance of all the groups, and the p-values and
+    confidence intervals come from the studentized range distribution, so
+    they already allow for the number of pairs. The T column is the
+    difference in means divided by its standard error, as in
+    ``pingouin.pairwise_tukey``. Within each level of `by`, only the
+    groups with values there count towards the number of groups and the
+    degrees of freedom, and the pairs of the others are left out.
+    """
+    n, mean, var, level, pair, a, b, index = _pairs(df, dv, between, by)
+    k = np.count_nonzero(n, axis=1)
+    df_within = n.sum(axis=1) - k
+    ms_within = np.nansum((n - 1) * var, axis=1) / df_within
+
+    diff = mean[level, a] - mean[level, b]
+    se = np.sqrt(ms_within[level] * (1 / n[level, a] + 1 / n[level, b]))
+    T = diff / se
+    # The studentized range takes one number of groups at a time, and the
+    # critical value only depends on that and the degrees of freedom
+    p = np.empty(len(T))
+    critical = np.empty(len(n))
+    for groups in set(k[level]):
+        rows, levels = k[level] == groups, k == groups
+        p[rows] = studentized_range_sf(np.abs(T[rows]) * np.sqrt(2), groups,
+                                       df_within[level[rows]])
+        critical[levels] = studentized_range_isf(1 - confidence, groups,
+                                                 df_within[levels])
+    margin = critical[level] / np.sqrt(2) * se
+    d = diff / np.sqrt(ms_within[level])
+    return pd.DataFrame({'estimate': diff, 'se': se, 'T': T,
+                         'dof': df_within[level], 'p': p,
+                         'ci_low': diff - margin, 'ci_high': diff + margin,
+                         'cohen_d': d}, index=index)
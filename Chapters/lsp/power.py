@@ -0,0 +1,59 @@
+"""Exact power calculations for the binomial test.
+
+Everything here broadcasts, so passing an array of values of theta and an
+array of sample sizes gives the power for every combination at once:
+
+>>> theta = np.arange(0.01, 0.99, 0.01)
+>>> N = np.arange(1, 10001)
+>>> surface = binomial_power(theta[:, None], N[None, :])   # shape (98, 10000)
+"""
+
+import numpy as np
+from scipy.special import bdtr, bdtrc
+from scipy.stats import binom
+
+
+def binomial_pmf(N, theta):
+    """Exact sampling distribution of the number of successes X.
+
+    Returns the possible values ``k = 0, 1, ..., N`` and their
+    probabilities, to be used instead of simulating binomial data.
+    """
+    k = np.arange(N + 1)
+    return k, binom.pmf(k, N, theta)
+
+
+def rejection_region(N, alpha=0.05, theta0=0.5):
+    """Critical values of a two-sided binomial test of ``theta = theta0``.
+
+    Returns ``(lo, hi)``; the null is rejected if ``X <= lo`` or
+    ``X > hi``. Each tail holds at most ``alpha / 2`` of the null
+    distribution.
+    """
+    N = np.asarray(N)
+    lo = binom.ppf(alpha / 2, N, theta0) - 1
+    hi = binom.ppf(1 - alpha / 2, N, theta0)
+    return lo, hi
+
+
+def binomial_power(theta, N, alpha=0.05, theta0=0.5, region=None):
+    """Probability of rejecting the null when the true value is `theta`.
+
+    The rejection region is the one from ``rejection_region`` unless an
+    explicit ``region=(lo, hi)`` is given, in which case the null is
+    rejected if ``X <= lo`` or ``X > hi``. `theta` and `N` broadcast
+    against each other.
+    """
+    # The critical values only depend on N, so work them out before
+    # broadcasting against theta
+    if region is None:
+        lo, hi = rejection_region(N, alpha, theta0)
+    else:
+        lo, hi = region
+    theta, N, lo, hi = np.broadcast_arrays(np.asarray(theta, dtype=float),
+                                           np.asarray(N), lo, hi)
+    # bdtr and bdtrc are the binomial cdf and survival function without
+    # the argument checking done by scipy.stats, which dominates the cost
+    # on large grids. bdtr is undefined below zero, where the cdf is 0.
+    lower = np.where(lo < 0, 0.0, bdtr(np.maximum(lo, 0), N, theta))
+    return lower + bdtrc(hi, N, theta)
@@ -0,0 +1,365 @@
+"""Rank-based (nonparametric) tests from one ranking of the data.
+
+Every test here starts by replacing the values by their ranks, giving tied
+values the average of the ranks they span. ``rankdata`` ranks each row of
+a 2-D array at once, and also returns the sum of ``t**3 - t`` over the
+groups of ``t`` tied values, which is all that the tie corrections need.
+The tests take one test per row, like those in ``lsp.ttest``:
+
+>>> kruskal(x, groups)             # x of shape (tests, n)
+>>> mann_whitney(x, y)
+>>> wilcoxon(before, after)
+>>> spearman(x, y)
+
+``Ranks`` wraps a DataFrame and ranks each column the first time a test
+needs it, so several tests on the same column share one ranking, and a
+list of columns is ranked and tested together:
+
+>>> ranks = Ranks(df)
+>>> ranks.kruskal('mood_gain', between='drug')
+>>> ranks.mann_whitney('mood_gain', between='therapy')   # same ranks
+>>> Ranks(parenthood).spearman('dan_grump', ['dan_sleep', 'baby_sleep'])
+
+Where the tests have an exact null distribution (Mann-Whitney and
+Wilcoxon, for small samples without ties), it is counted with the
+generating functions of the rank sums. The Wilcoxon test of a few
+differences with ties or zeros instead goes through all the ways of
+signing the ranks, and otherwise the normal approximation with the tie
+correction is used, as in ``scipy.stats``.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from lsp.anova import group_codes
+from lsp.sampling import BLOCK_SIZE
+from lsp.ttest import ALTERNATIVES
+
+# Largest samples for which the exact distributions are used by default,
+# as in scipy.stats: for Mann-Whitney, that of the smaller sample, and for
+# Wilcoxon, the number of differences without and with ties or zeros
+EXACT_MANN_WHITNEY = 8
+EXACT_WILCOXON = 50
+PERMUTATION_WILCOXON = 13
+
+
+def _rows(x):
+    return np.atleast_2d(np.asarray(x, dtype=float))
+
+
+def rankdata(x):
+    """Average ranks along each row of `x`, and the tie sums of each row.
+
+    Missing values (NaN) get no rank and are not counted. Returns the
+    ranks, with the shape of `x` as a 2-D array, and for each row the sum
+    of ``t**3 - t`` over the groups of ``t`` tied values.
+    """
+    x = _rows(x)
+    rows, m = x.shape
+    order = np.argsort(x, axis=1, kind='stable')
+    ordered = np.take_along_axis(x, order, axis=1)
+    valid = ~np.isnan(ordered)
+
+    # Number the runs of equal values; a run never continues onto the
+    # next row, and every NaN is a run of its own
+    new = np.ones(x.shape, dtype=bool)
+    new[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+    run = np.cumsum(new.ravel()) - 1
+    size = np.bincount(run)
+    position = np.tile(np.arange(1.0, m + 1), rows)
+    average = np.bincount(run, weights=position) / size
+
+    ranks = np.empty(x.shape)
+    np.put_along_axis(ranks, order,
+                      np.where(valid, average[run].reshape(x.shape), np.nan),
+                      axis=1)
+    first = new.ravel()
+    row = np.repeat(np.arange(rows), m)[first]
+    ties = np.bincount(row, weights=(size ** 3 - size) * valid.ravel()[first],
+                       minlength=rows)
+    return ranks, ties
+
+
+def _sum_counts(n):
+    """Number of subsets of the ranks 1..n with each possible sum, the
+    coefficients of (1 + q)(1 + q^2)...(1 + q^n)."""
+    counts = np.zeros(n * (n + 1) // 2 + 1)
+    counts[0] = 1
+    for i in range(1, n + 1):
+        counts[i:] = counts[i:] + counts[:-i]
+    return counts
+
+
+def _u_counts(n1, n2):
+    """Number of ways of getting each value of the Mann-Whitney U, the
+    coefficients of the Gaussian binomial coefficient [n1 + n2, n1]_q."""
+    size = n1 * n2 + 1
+    counts = np.zeros(size)
+    counts[0] = 1
+    for i in range(1, n1 + 1):
+        # Multiply by 1 - q^(n2 + i) and divide by 1 - q^i, as power series
+        a = n2 + i
+        counts[a:] = counts[a:] - counts[:size - a]
+        for start in range(i):
+            counts[start::i] = np.cumsum(counts[start::i])
+    return counts
+
+
+def _exact_p(counts, statistic, alternative, center):
+    """P-value of `statistic` from the `counts` of each of its values."""
+    cdf = np.cumsum(counts) / counts.sum()
+    statistic = np.rint(statistic).astype(int)
+    below = cdf[statistic]
+    above = 1 - np.concatenate([[0], cdf])[statistic]
+    if alternative == 'greater':
+        return above
+    if alternative == 'less':
+        return below
+    return np.minimum(2 * np.where(statistic >= center, above, below), 1)
+
+
+def _normal_p(z, alternative):
+    if alternative == 'greater':
+        return stats.norm.sf(z)
+    if alternative == 'less':
+        return stats.norm.cdf(z)
+    return 2 * stats.norm.sf(np.abs(z))
+
+
+def _check(alternative):
+    if alternative not in ALTERNATIVES:
+        raise ValueError('alternative must be one of %s' % (ALTERNATIVES,))
+
+
+def _kruskal(ranks, ties, codes, k):
+    valid = ~np.isnan(ranks)
+    onehot = np.eye(k)[codes]
+    n = valid @ onehot
+    sums = np.nan_to_num(ranks) @ onehot
+    total = valid.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        H = (12 / (total * (total + 1)) * np.nansum(sums ** 2 / n, axis=1)
+             - 3 * (total + 1))
+    H = H / (1 - ties / (total ** 3 - total))
+    dof = np.count_nonzero(n, axis=1) - 1
+    return pd.DataFrame({'H': H, 'dof': dof, 'p': stats.chi2.sf(H, dof)})
+
+
+def kruskal(x, groups):
+    """Kruskal-Wallis tests of each row of `x` across the `groups`.
+
+    `groups` labels the columns of `x` and is the same for every row;
+    columns without a label are left out before ranking. The statistic
+    ``H`` is corrected for ties, as in ``scipy.stats.kruskal`` and
+    ``pingouin.kruskal``.
+    """
+    codes, labels = pd.factorize(np.asarray(groups), sort=True)
+    keep = codes >= 0
+    return _kruskal(*rankdata(_rows(x)[:, keep]), codes[keep], len(labels))
+
+
+def _mann_whitney(ranks, ties, first, alternative):
+    """Mann-Whitney tests from the ranks of both samples together, where
+    `first` marks the columns of the first sample."""
+    valid = ~np.isnan(ranks)
+    n1 = np.sum(valid & first, axis=1)
+    n2 = np.sum(valid & ~first, axis=1)
+    total = n1 + n2
+    U = np.nansum(np.where(first, ranks, np.nan), axis=1) - n1 * (n1 + 1) / 2
+
+    # Normal approximation with continuity and tie corrections
+    mean = n1 * n2 / 2
+    sd = np.sqrt(n1 * n2 / 12 * ((total + 1) - ties / (total * (total - 1))))
+    if alternative == 'two-sided':
+        z = (np.maximum(U, n1 * n2 - U) - mean - 0.5) / sd
+        p = np.minimum(2 * stats.norm.sf(z), 1)
+    else:
+        z = (U - mean + (0.5 if alternative == 'less' else -0.5)) / sd
+        p = _normal_p(z, alternative)
+
+    exact = (ties == 0) & (np.minimum(n1, n2) <= EXACT_MANN_WHITNEY)
+    for a, b in set(zip(n1[exact], n2[exact])):
+        rows = exact & (n1 == a) & (n2 == b)
+        p[rows] = _exact_p(_u_counts(a, b), U[rows], alternative, a * b / 2)
+    return pd.DataFrame({'U': U, 'p': p})
+
+
+def mann_whitney(x, y, alternative='two-sided'):
+    """Mann-Whitney U tests of each row of `x` against the same row of `y`.
+
+    ``U`` is the statistic of `x`, as in ``scipy.stats.mannwhitneyu``, and
+    the p-value is exact when either sample has at most 8 values and there
+    are no ties. Pad rows with NaN where the samples differ in size.
+    """
+    _check(alternative)
+    x, y = _rows(x), _rows(y)
+    rows = max(len(x), len(y))
+    x = np.broadcast_to(x, (rows, x.shape[1]))
+    y = np.broadcast_to(y, (rows, y.shape[1]))
+    first = np.repeat([True, False], [x.shape[1], y.shape[1]])
+    return _mann_whitney(*rankdata(np.hstack([x, y])), first, alternative)
+
+
+def _signed_p(ranks, positive, alternative):
+    """Permutation p-values of the sums of positive ranks, `positive`,
+    over all the ways of signing each row of `ranks`."""
+    m = ranks.shape[1]
+    signs = (np.arange(2 ** m)[:, None] >> np.arange(m)) & 1
+    # Same tolerance as scipy.stats.permutation_test
+    tolerance = np.abs(positive) * np.finfo(float).eps * 100
+    p = np.empty(len(ranks))
+    rows = max(1, BLOCK_SIZE // len(signs))
+    for start in range(0, len(ranks), rows):
+        block = slice(start, start + rows)
+        sums = ranks[block] @ signs.T
+        above = np.mean(sums >= (positive - tolerance)[block, None], axis=1)
+        below = np.mean(sums <= (positive + tolerance)[block, None], axis=1)
+        if alternative == 'greater':
+            p[block] = above
+        elif alternative == 'less':
+            p[block] = below
+        else:
+            p[block] = np.minimum(2 * np.minimum(above, below), 1)
+    return p
+
+
+def wilcoxon(x, y=None, alternative='two-sided'):
+    """Wilcoxon signed-rank tests of each row of `x` (minus that of `y`).
+
+    Zero differences are dropped, as in ``scipy.stats.wilcoxon``. For a
+    two-sided test ``W`` is the smaller of the sums of the positive and
+    the negative ranks, and otherwise the sum of the positive ranks. The
+    p-value is exact for up to 50 differences without ties or zeros; with
+    them, it is the exact permutation p-value for up to 13 differences
+    (zeros included), which is what ``scipy.stats.wilcoxon`` computes
+    there with ``permutation_test``, and the normal approximation above.
+    """
+    _check(alternative)
+    d = _rows(x) if y is None else _rows(x) - _rows(y)
+    zeros = np.sum(d == 0, axis=1)
+    d = np.where(d == 0, np.nan, d)
+    ranks, ties = rankdata(np.abs(d))
+    n = np.sum(~np.isnan(d), axis=1)
+    positive = np.nansum(np.where(d > 0, ranks, 0), axis=1)
+    negative = n * (n + 1) / 2 - positive
+    if alternative == 'two-sided':
+        W = np.minimum(positive, negative)
+    else:
+        W = positive
+
+    mean = n * (n + 1) / 4
+    sd = np.sqrt(n * (n + 1) * (2 * n + 1) / 24 - ties / 48)
+    p = _normal_p((W - mean) / sd, alternative)
+    if alternative == 'two-sided':
+        p = np.minimum(p, 1)
+
+    untied = (ties == 0) & (zeros == 0)
+    exact = untied & (n <= EXACT_WILCOXON)
+    for m in set(n[exact]):
+        rows = exact & (n == m)
+        p[rows] = _exact_p(_sum_counts(m), W[rows], alternative,
+                           m * (m + 1) / 4)
+    permute = ~untied & (n + zeros <= PERMUTATION_WILCOXON)
+    for m in set(n[permute]):
+        rows = np.flatnonzero(permute & (n == m))
+        # Each row's ranks, moved to the front
+        tied = np.sort(ranks[rows], axis=1)[:, :m]
+        p[rows] = _signed_p(tied, positive[rows], alternative)
+    return pd.DataFrame({'W': W, 'p': p})
+
+
+def _pearson(x, y):
+    x = x - x.mean(axis=1, keepdims=True)
+    y = y - y.mean(axis=1, keepdims=True)
+    return (np.sum(x * y, axis=1)
+            / np.sqrt(np.sum(x * x, axis=1) * np.sum(y * y, axis=1)))
+
+
+def _spearman(rx, ry):
+    n = rx.shape[1]
+    rho = _pearson(rx, ry)
+    with np.errstate(divide='ignore'):
+        T = rho * np.sqrt((n - 2) / ((1 - rho) * (1 + rho)))
+    return pd.DataFrame({'rho': rho, 'p': 2 * stats.t.sf(np.abs(T), n - 2)})
+
+
+def spearman(x, y):
+    """Spearman rank correlations of each row of `x` with that of `y`.
+
+    The p-value uses the t distribution with ``n - 2`` degrees of freedom,
+    as ``scipy.stats.spearmanr`` does. Rows must not have missing values.
+    """
+    x, y = np.broadcast_arrays(_rows(x), _rows(y))
+    return _spearman(rankdata(x)[0], rankdata(y)[0])
+
+
+class Ranks:
+    """The ranks of the columns of a DataFrame, computed when first needed.
+
+    All the columns that a test asks for and that have not been ranked
+    yet are ranked together, with one call to ``rankdata``.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self._ranks = {}
+        self._ties = {}
+
+    def ranks(self, columns):
+        """Ranks (one row per column) and tie sums of `columns`."""
+        missing = [c for c in columns if c not in self._ranks]
+        if missing:
+            ranks, ties = rankdata(self.df[missing].to_numpy(dtype=float).T)
+            self._ranks.update(zip(missing, ranks))
+            self._ties.update(zip(missing, ties))
+        return (np.array([self._ranks[c] for c in columns]),
+                np.array([self._ties[c] for c in columns]))
+
+    def _grouped(self, dv, between):
+        """Ranks of the `dv` columns and the group codes, re-ranking only
+        if some values have no group and so must be left out."""
+        columns = [dv] if isinstance(dv, str) else list(dv)
+        codes, labels = group_codes(self.df, between)
+        keep = codes >= 0
+        if keep.all():
+            ranks, ties = self.ranks(columns)
+        else:
+            ranks, ties = rankdata(
+                self.df.loc[keep, columns].to_numpy(dtype=float).T)
+        return ranks, ties, codes[keep], labels, pd.Index(columns)
+
+    def kruskal(self, dv, between):
+        """Kruskal-Wallis test of column `dv` (or of each of a list of
+        columns) across the groups in `between`."""
+        ranks, ties, codes, labels, index = self._grouped(dv, between)
+        result = _kruskal(ranks, ties, codes, len(labels))
+        result.index = index
+        return result
+
+    def mann_whitney(self, dv, between, alternative='two-sided'):
+        """Mann-Whitney test of column `dv` (or of each of a list of
+        columns) between the two groups in `between`; ``U`` is that of
+        the first group."""
+        _check(alternative)
+        ranks, ties, codes, labels, index = self._grouped(dv, between)
+        if len(labels) != 2:
+            raise ValueError('%r has %d groups, the Mann-Whitney test needs 2'
+                             % (between, len(labels)))
+        result = _mann_whitney(ranks, ties, codes == 0, alternative)
+        result.index = index
+        return result
+
+    def spearman(self, x, y):
+        """Spearman correlation of column `x` with column `y`, or with each
+        of a list of columns. Rows missing either value are left out."""
+        columns = [y] if isinstance(y, str) else list(y)
+        if self.df[[x] + columns].isna().any(axis=None):
+            result = pd.concat([
+                spearman(*self.df[[x, c]].dropna().to_numpy(dtype=float).T)
+                for c in columns])
+        else:
+            ranks, _ = self.ranks([x] + columns)
+            result = _spearman(ranks[:1], ranks[1:])
+        result.index = pd.Index(columns)
+        return result
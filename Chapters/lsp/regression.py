@@ -0,0 +1,213 @@
+"""Linear regression from a single factorization of the predictors.
+
+A ``Design`` holds the predictor matrix (with an intercept column) and its
+QR decomposition, which is the expensive part of fitting a regression. Each
+``fit`` then only needs a few matrix-vector products and a triangular solve,
+and returns the coefficients with their standard errors, t-tests and
+confidence intervals, R squared, adjusted R squared and the F-test of the
+model all at once:
+
+>>> design = Design(df, ['dan_sleep', 'baby_sleep'])
+>>> full = design.fit(df['dan_grump'])
+>>> full.coefficients, full.r2, full.F, full.p
+
+Models that use only some of the predictors reuse the same decomposition:
+if ``X = QR``, the columns ``S`` of ``X`` are ``Q R[:, S]``, so only the
+small matrix ``R[:, S]`` has to be factorized again. That makes it cheap to
+compare nested models:
+
+>>> reduced = design.fit(df['dan_grump'], predictors=['dan_sleep'])
+>>> compare(reduced, full)
+
+``fit_many`` regresses a whole table of outcomes on the same predictors.
+All of them are solved together, with one matrix product and one
+triangular solve, and the leverages that the residual diagnostics need
+are shared between them:
+
+>>> fits = Design(df, 'x').fit_many(df[['y', 'y2']])
+>>> fits.coefficients.loc['y2'], fits.summary, fits.cooks
+"""
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from scipy.linalg import solve_triangular
+
+RegressionResult = namedtuple('RegressionResult', [
+    'coefficients', 'r2', 'adj_r2', 'F', 'p', 'df_model', 'df_resid', 'rss',
+    'fitted', 'residuals'])
+MultiRegressionResult = namedtuple('MultiRegressionResult', [
+    'coefficients', 'summary', 'fitted', 'residuals', 'standardized',
+    'cooks'])
+CompareResult = namedtuple('CompareResult', ['F', 'df_num', 'df_den', 'p'])
+
+
+class Design:
+    """The predictors of a regression model and their QR decomposition.
+
+    `predictors` is a column name or a list of them. Rows of `df` with a
+    missing value in any predictor are left out of every fit.
+    """
+
+    def __init__(self, df, predictors, intercept=True):
+        if isinstance(predictors, str):
+            predictors = [predictors]
+        X = df[list(predictors)].to_numpy(dtype=float)
+        self.rows = ~np.isnan(X).any(axis=1)
+        X = X[self.rows]
+        if intercept:
+            X = np.column_stack([np.ones(len(X)), X])
+        self.intercept = intercept
+        self.names = ['Intercept'] * intercept + list(predictors)
+        self.X = X
+        self.q, self.r = np.linalg.qr(X)
+        # (Q2, R2) with R[:, columns] = Q2 R2, for each subset of columns
+        self._factors = {}
+
+    def _columns(self, predictors):
+        if predictors is None:
+            return tuple(range(len(self.names)))
+        if isinstance(predictors, str):
+            predictors = [predictors]
+        return ((0,) * self.intercept
+                + tuple(self.names.index(name) for name in predictors))
+
+    def _factor(self, columns):
+        if columns not in self._factors:
+            if columns == tuple(range(len(self.names))):
+                factor = np.eye(len(columns)), self.r
+            else:
+                factor = np.linalg.qr(self.r[:, columns])
+            self._factors[columns] = factor
+        return self._factors[columns]
+
+    def _outcome(self, y):
+        y = np.asarray(y, dtype=float)[self.rows]
+        if np.isnan(y).any():
+            raise ValueError('The outcome has missing values')
+        return y
+
+    def _solve(self, Y, predictors):
+        """Coefficients of every column of `Y` on the chosen predictors."""
+        columns = self._columns(predictors)
+        q2, r = self._factor(columns)
+        coef = solve_triangular(r, q2.T @ (self.q.T @ Y))
+        return columns, q2, r, coef
+
+    def fit(self, y, predictors=None, confidence=0.95):
+        """Regress `y` on all the predictors, or on the named subset."""
+        Y = self._outcome(y)[:, None]
+        columns, _, r, coef = self._solve(Y, predictors)
+        fitted = self.X[:, columns] @ coef
+        residuals = Y - fitted
+        table, fit = _statistics(Y, coef, r, residuals, self.intercept,
+                                 confidence)
+        coefficients = pd.DataFrame(
+            {name: values[:, 0] for name, values in table.items()},
+            index=pd.Index([self.names[c] for c in columns], name='names'))
+        return RegressionResult(coefficients,
+                                *(values[0] for values in fit.values()),
+                                fitted[:, 0], residuals[:, 0])
+
+    def rss(self, y, predictors=None):
+        """Residual sum of squares of `y` on all the predictors, or on the
+        named subset, without the rest of the fit (so also for models with
+        no residual degrees of freedom). A 2-D `y` gives one per column."""
+        Y = self._outcome(y)
+        columns, _, _, coef = self._solve(Y, predictors)
+        return np.sum((Y - self.X[:, columns] @ coef) ** 2, axis=0)
+
+    def fit_many(self, Y, predictors=None, confidence=0.95):
+        """Regress every column of the DataFrame `Y` on the same predictors.
+
+        Returns a ``MultiRegressionResult`` with the coefficient tables of
+        all outcomes (indexed by outcome and predictor), a ``summary`` with
+        the R squared, F-test and residual standard error of each outcome,
+        and DataFrames of the fitted values, residuals, standardized
+        residuals and Cook's distances, with one column per outcome.
+        """
+        outcomes = pd.Index(Y.columns, name='outcome')
+        Y = self._outcome(Y)
+        columns, q2, r, coef = self._solve(Y, predictors)
+        fitted = self.X[:, columns] @ coef
+        residuals = Y - fitted
+        table, fit = _statistics(Y, coef, r, residuals, self.intercept,
+                                 confidence)
+
+        names = [self.names[c] for c in columns]
+        coefficients = pd.DataFrame(
+            {name: values.T.ravel() for name, values in table.items()},
+            index=pd.MultiIndex.from_product([outcomes, names],
+                                             names=['outcome', 'names']))
+        summary = pd.DataFrame(fit, index=outcomes)
+        summary['sigma'] = np.sqrt(summary['rss'] / summary['df_resid'])
+
+        # The leverages only depend on the predictors, so they are the same
+        # for every outcome
+        leverage = np.sum((self.q @ q2) ** 2, axis=1)[:, None]
+        standardized = residuals / (summary['sigma'].to_numpy()
+                                    * np.sqrt(1 - leverage))
+        cooks = standardized ** 2 * leverage / (1 - leverage) / len(columns)
+
+        def frame(values):
+            return pd.DataFrame(values, columns=outcomes)
+        return MultiRegressionResult(coefficients, summary, frame(fitted),
+                                     frame(residuals), frame(standardized),
+                                     frame(cooks))
+
+
+def _statistics(Y, coef, r, residuals, intercept, confidence):
+    """The coefficient tests and the fit statistics for each column of `Y`,
+    as two dicts of arrays."""
+    n, k = Y.shape[0], coef.shape[0]
+    m = Y.shape[1]
+    df_resid = n - k
+    df_model = k - intercept
+    rss = np.sum(residuals ** 2, axis=0)
+    if intercept:
+        tss = np.sum((Y - Y.mean(axis=0)) ** 2, axis=0)
+    else:
+        tss = np.sum(Y ** 2, axis=0)
+    sigma2 = rss / df_resid
+
+    # The covariance matrix of the coefficients is sigma2 (R'R)^-1, whose
+    # diagonal is sigma2 times the squared row norms of R^-1
+    r_inv = solve_triangular(r, np.eye(k))
+    se = np.sqrt(np.outer(np.sum(r_inv ** 2, axis=1), sigma2))
+    T = coef / se
+    margin = stats.t.ppf(0.5 + confidence / 2, df_resid) * se
+    table = {'coef': coef, 'se': se, 'T': T,
+             'p': 2 * stats.t.sf(np.abs(T), df_resid),
+             'ci_low': coef - margin, 'ci_high': coef + margin}
+
+    r2 = 1 - rss / tss
+    if df_model:
+        F = (tss - rss) / df_model / sigma2
+        p = stats.f.sf(F, df_model, df_resid)
+    else:
+        F = p = np.full(m, np.nan)
+    fit = {'r2': r2, 'adj_r2': 1 - (1 - r2) * (n - intercept) / df_resid,
+           'F': F, 'p': p, 'df_model': np.full(m, df_model),
+           'df_resid': np.full(m, df_resid), 'rss': rss}
+    return table, fit
+
+
+def linear_regression(df, outcome, predictors, intercept=True,
+                      confidence=0.95):
+    """Regress column `outcome` of `df` on the columns in `predictors`."""
+    return Design(df, predictors, intercept).fit(df[outcome],
+                                                 confidence=confidence)
+
+
+def compare(reduced, full):
+    """F-test of whether `full` fits better than the nested model `reduced`.
+
+    Both are ``RegressionResult``s for the same outcome, where the
+    predictors of `reduced` are a subset of those of `full`.
+    """
+    df_num = reduced.df_resid - full.df_resid
+    F = (reduced.rss - full.rss) / df_num / (full.rss / full.df_resid)
+    return CompareResult(F, df_num, full.df_resid,
+                         stats.f.sf(F, df_num, full.df_resid))
@@ -0,0 +1,60 @@
+"""Reproducible random numbers for the simulations in the book.
+
+Every simulation asks for its own random number generator by name, e.g.
+``generator('estimation', 'clt')``. The names are turned into the spawn key
+of a ``np.random.SeedSequence`` under one project-wide seed, so that
+
+* the same names always give the same random numbers, and a notebook
+  produces the same output every time it is run, whatever ran before it;
+* different names give independent streams, so adding a simulation to one
+  figure does not change the random numbers in any other.
+
+Set the environment variable ``LSP_SEED`` to an integer to get a different,
+but still reproducible, set of streams for the whole book.
+
+Functions that share work between processes (``lsp.montecarlo``,
+``lsp.bootstrap``) take a `seed` and give each worker a child of
+``seed_sequence(seed)`` via ``SeedSequence.spawn``.
+"""
+
+import hashlib
+import os
+
+import numpy as np
+
+ROOT_SEED = int(os.environ.get('LSP_SEED', 20220224))
+
+
+def _key(name):
+    if isinstance(name, int):
+        return name
+    digest = hashlib.sha256(str(name).encode()).digest()
+    return int.from_bytes(digest[:8], 'little')
+
+
+def stream(*names):
+    """The ``SeedSequence`` for the stream with the given names."""
+    return np.random.SeedSequence(ROOT_SEED,
+                                  spawn_key=tuple(_key(n) for n in names))
+
+
+def generator(*names):
+    """A ``np.random.Generator`` for the stream with the given names.
+
+    >>> rng = generator('probability', 'normal')
+    >>> rng.normal(0, 1, 1000)
+    """
+    return np.random.default_rng(stream(*names))
+
+
+def seed_sequence(seed=None):
+    """Turn a `seed` argument into a ``SeedSequence`` that can be spawned.
+
+    `seed` may be None (fresh entropy), an integer, a ``SeedSequence`` or a
+    ``Generator``, from which a new seed is drawn.
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    if isinstance(seed, np.random.Generator):
+        return np.random.SeedSequence(seed.integers(2 ** 63))
+    return np.random.SeedSequence(seed)
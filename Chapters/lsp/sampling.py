@@ -0,0 +1,101 @@
+"""Simulated sampling distributions.
+
+Instead of running one simulated experiment at a time in a Python loop,
+every experiment is drawn at once as a ``(reps, n)`` array, with one row
+per experiment, and the statistic is computed along the rows.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+# Number of random values to hold in memory at once. Larger simulations are
+# drawn in blocks of rows of about this size.
+BLOCK_SIZE = 2 ** 22
+
+
+STATISTICS = {
+    'mean': np.mean,
+    'median': np.median,
+    'max': np.max,
+    'min': np.min,
+    'range': np.ptp,
+    'sd': lambda x, axis: np.std(x, axis=axis, ddof=1),
+    'var': lambda x, axis: np.var(x, axis=axis, ddof=1),
+}
+
+
+def draw(dist, size, rng):
+    """Draw an array of the given size from `dist`.
+
+    `dist` is either a frozen scipy.stats distribution, such as
+    ``stats.norm(100, 15)``, or a function called as ``dist(rng, size)``.
+    """
+    if hasattr(dist, 'rvs'):
+        return dist.rvs(size=size, random_state=rng)
+    return dist(rng, size)
+
+
+def reduce_rows(values, statistic):
+    """Apply `statistic` to each row of a 2-D array.
+
+    `statistic` is one of the names in ``STATISTICS``, a ufunc such as
+    ``np.maximum`` (which is reduced along the rows), or a function that
+    takes an array and an ``axis`` argument, such as ``np.median``.
+    """
+    if isinstance(statistic, str):
+        statistic = STATISTICS[statistic]
+    if isinstance(statistic, np.ufunc):
+        return statistic.reduce(values, axis=1)
+    return statistic(values, axis=1)
+
+
+def sampling_distribution(dist, statistic, n, reps=10000, rng=None):
+    """Simulate `reps` experiments with `n` observations each.
+
+    Returns an array holding the value of `statistic` in each experiment.
+    `dist` is a frozen scipy.stats distribution or a function
+    ``dist(rng, size)``, see ``draw``. `statistic` is described in
+    ``reduce_rows``.
+
+    >>> iq = lambda rng, size: rng.normal(100, 15, size).astype(int)
+    >>> sample_means = sampling_distribution(iq, 'mean', n=5)
+    """
+    rng = np.random.default_rng(rng)
+    rows = max(1, BLOCK_SIZE // n)
+    results = []
+    for start in range(0, reps, rows):
+        block = draw(dist, (min(rows, reps - start), n), rng)
+        results.append(reduce_rows(block, statistic))
+    return np.concatenate(results)
+
+
+def clt_approximation(dist, n):
+    """The normal distribution of the mean of `n` draws from `dist`.
+
+    By the central limit theorem the sampling distribution of the mean
+    approaches this as `n` grows, whatever the shape of `dist`, which must
+    be a frozen scipy.stats distribution with a finite variance.
+    """
+    return stats.norm(dist.mean(), dist.std() / np.sqrt(n))
+
+
+def running_proportion(n_flips, n_runs=1, p=0.5, seed=None):
+    """Simulate `n_runs` runs of `n_flips` coin flips each.
+
+    Each flip comes up heads with probability `p`. Returns a long-format
+    DataFrame with one row per flip and the columns ``flips`` (the number
+    of flips so far), ``proportion_heads`` (the proportion of heads so far)
+    and ``runs`` (a categorical of ``'run1'``, ``'run2'``, ...).
+    """
+    rng = np.random.default_rng(seed)
+    heads = rng.random((n_runs, n_flips)) < p
+    flips = np.arange(1, n_flips + 1)
+    proportion = np.cumsum(heads, axis=1) / flips
+    return pd.DataFrame(
+        {'flips': np.tile(flips, n_runs),
+         'proportion_heads': proportion.ravel(),
+         'runs': pd.Categorical.from_codes(
+             np.repeat(np.arange(n_runs), n_flips),
+             ['run%d' % (i + 1) for i in range(n_runs)])
+        })
@@ -0,0 +1,176 @@
+"""Many t-tests at once.
+
+Each function here takes a 2-D array with one test per row (a 1-D array is
+a single test) and returns a DataFrame with one row per test, holding t,
+its degrees of freedom, the p-value, the confidence interval and Cohen's d.
+Only the count, mean and variance of each row are needed, and those are
+computed for all rows together, so a thousand tests cost little more than
+one. Missing values (NaN) are left out, row by row.
+
+>>> ttest_ind(treatment, control)          # arrays of shape (tests, n)
+
+``ttest_from_moments`` runs the same tests from the counts, means and
+variances alone. For data in long format, ``grouped_ttest`` compares the
+two groups in one column within each level of another:
+
+>>> grouped_ttest(df, dv='grade', between='tutor')
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from lsp.anova import group_codes
+
+ALTERNATIVES = ('two-sided', 'greater', 'less')
+
+
+def _rows(x):
+    return np.atleast_2d(np.asarray(x, dtype=float))
+
+
+def _moments(x):
+    """Count, mean and variance (ddof=1) of each row, ignoring NaN."""
+    x = _rows(x)
+    n = np.sum(~np.isnan(x), axis=1)
+    mean = np.nansum(x, axis=1) / n
+    var = np.nansum((x - mean[:, None]) ** 2, axis=1) / (n - 1)
+    return n, mean, var
+
+
+def _result(estimate, se, dof, d, null, alternative, confidence):
+    """Finish a t-test from the estimated mean (difference), its standard
+    error and the degrees of freedom."""
+    if alternative not in ALTERNATIVES:
+        raise ValueError('alternative must be one of %s' % (ALTERNATIVES,))
+    T = (estimate - null) / se
+    if alternative == 'two-sided':
+        p = 2 * stats.t.sf(np.abs(T), dof)
+        margin = stats.t.ppf(0.5 + confidence / 2, dof) * se
+        low, high = estimate - margin, estimate + margin
+    elif alternative == 'greater':
+        p = stats.t.sf(T, dof)
+        low = estimate - stats.t.ppf(confidence, dof) * se
+        high = np.full_like(low, np.inf)
+    else:
+        p = stats.t.cdf(T, dof)
+        high = estimate + stats.t.ppf(confidence, dof) * se
+        low = np.full_like(high, -np.inf)
+    return pd.DataFrame({'estimate': estimate, 'T': T, 'dof': dof, 'p': p,
+                         'ci_low': low, 'ci_high': high, 'cohen_d': d})
+
+
+def ttest_1samp(x, popmean=0, alternative='two-sided', confidence=0.95):
+    """One-sample t-tests of each row of `x` against `popmean`.
+
+    The ``estimate`` and confidence interval are for the mean of each row,
+    as in ``pingouin.ttest``; Cohen's d is ``(mean - popmean) / sd``.
+    `popmean` may be a single value or one value per row.
+    """
+    n, mean, var = _moments(x)
+    sd = np.sqrt(var)
+    d = (mean - popmean) / sd
+    return _result(mean, sd / np.sqrt(n), n - 1.0, d, popmean,
+                   alternative, confidence)
+
+
+def ttest_rel(x, y, alternative='two-sided', confidence=0.95):
+    """Paired-samples t-tests of each row of `x` against the same row of `y`.
+
+    The test is a one-sample test of the differences ``x - y``; pairs with
+    a missing value on either side are left out. The ``estimate`` is the
+    mean difference, and Cohen's d divides it by the average of the two
+    standard deviations, as in ``pingouin.ttest(..., paired=True)``.
+    """
+    x, y = np.broadcast_arrays(_rows(x), _rows(y))
+    both = ~(np.isnan(x) | np.isnan(y))
+    x, y = np.where(both, x, np.nan), np.where(both, y, np.nan)
+    n, mean, var = _moments(x - y)
+    d = mean / np.sqrt((_moments(x)[2] + _moments(y)[2]) / 2)
+    return _result(mean, np.sqrt(var / n), n - 1.0, d, 0,
+                   alternative, confidence)
+
+
+def ttest_from_moments(n1, mean1, var1, n2, mean2, var2, equal_var=True,
+                       alternative='two-sided', confidence=0.95):
+    """Independent-samples t-tests from the count, mean and variance of
+    each group, as ``ttest_ind`` on the raw data would give.
+
+    The arguments may be arrays, one test per element, for instance the
+    cells of ``cell_moments``.
+    """
+    diff = mean1 - mean2
+    pooled = ((n1 - 1) * var1 + (n2 - 1) * var2) / (n1 + n2 - 2)
+    d = diff / np.sqrt(pooled)
+    if equal_var:
+        se = np.sqrt(pooled * (1 / n1 + 1 / n2))
+        dof = n1 + n2 - 2.0
+    else:
+        a, b = var1 / n1, var2 / n2
+        se = np.sqrt(a + b)
+        dof = (a + b) ** 2 / (a ** 2 / (n1 - 1) + b ** 2 / (n2 - 1))
+    return _result(diff, se, dof, d, 0, alternative, confidence)
+
+
+def ttest_ind(x, y, equal_var=True, alternative='two-sided',
+              confidence=0.95):
+    """Independent-samples t-tests of each row of `x` against that of `y`.
+
+    Student's test by default, Welch's with ``equal_var=False``. The
+    ``estimate`` is the difference in means, and Cohen's d divides it by
+    the pooled standard deviation. `x` and `y` may have different numbers
+    of columns; pad rows with NaN where the groups differ in size.
+    """
+    return ttest_from_moments(*_moments(x), *_moments(y), equal_var,
+                              alternative, confidence)
+
+
+def cell_moments(df, dv, between, by=None):
+    """Count, mean and variance of `dv` in every group of `between`, within
+    every level of `by`.
+
+    Returns the three as arrays of shape ``(levels of by, groups)``, with
+    the labels of the levels and of the groups. All of the cells come from
+    a few ``np.bincount`` calls, without splitting the data frame.
+    """
+    g, groups = group_codes(df, between)
+    if by is None:
+        b, levels = np.zeros(len(df), dtype=int), pd.Index([dv])
+    else:
+        b, levels = group_codes(df, by)
+        levels = pd.Index(levels, name=by)
+    y = df[dv].to_numpy(dtype=float)
+    keep = (g >= 0) & (b >= 0) & ~np.isnan(y)
+    k = len(groups)
+    cells = b[keep] * k + g[keep]
+    y = y[keep]
+
+    size = k * len(levels)
+    n = np.bincount(cells, minlength=size)
+    mean = np.bincount(cells, weights=y, minlength=size) / n
+    ss = np.bincount(cells, weights=(y - mean[cells]) ** 2, minlength=size)
+    var = ss / (n - 1)
+    shape = (len(levels), k)
+    return (n.reshape(shape), mean.reshape(shape), var.reshape(shape),
+            levels, groups)
+
+
+def grouped_ttest(df, dv, between, by=None, equal_var=True,
+                  alternative='two-sided', confidence=0.95):
+    """Independent-samples t-tests on a long-format DataFrame.
+
+    `between` must have two groups; the first (in sorted or categorical
+    order) is compared against the second. With `by`, one test is run for
+    every level of that column, and the result is indexed by it. The
+    counts, means and variances of all the cells come from
+    ``cell_moments``.
+    """
+    n, mean, var, levels, groups = cell_moments(df, dv, between, by)
+    if len(groups) != 2:
+        raise ValueError('%r has %d groups, a t-test needs 2'
+                         % (between, len(groups)))
+    result = ttest_from_moments(n[:, 0], mean[:, 0], var[:, 0], n[:, 1],
+                                mean[:, 1], var[:, 1], equal_var, alternative,
+                                confidence)
+    result.index = levels
+    return result
@@ -1,7 +1,45 @@
 #!/bin/bash
 
+# Usage: ./build.sh [--full]
+#
+# By default the book is built incrementally: notebooks are only executed
+# when their code has changed (execute_notebooks: cache in yaml/_config.yml),
+# and Sphinx only rewrites the pages whose source, or whose dependencies
+# (toc, bibliography, cross-references), have changed since the last build.
+# The execution cache does not know which notebooks import which modules of
+# Chapters/lsp, so it is cleared whenever one of them is newer than the last
+# successful build. Use --full to throw away the build and the execution
+# cache first.
+
+ROOT=/Users/ethan/Documents/GitHub/pythonbook
+BUILD=$ROOT/Book/_build
+
+if [ "$1" == "--full" ]; then
+    jupyter-book clean --all $ROOT/Book
+fi
+
+# re-execute every notebook if the lsp package changed since the last build
+# (or if there is no record of when that was)
+LSP_STAMP=$BUILD/.lsp_built
+if [ ! -f $LSP_STAMP ] || [ -n "$(find $ROOT/Chapters/lsp -name '*.py' -newer $LSP_STAMP)" ]; then
+    echo "Chapters/lsp may have changed, clearing the execution cache"
+    rm -rf $BUILD/.jupyter_cache
+fi
+
+# write typed Feather copies of the datasets (skipped without pyarrow)
+(cd $ROOT/Chapters && python -m lsp.data > /dev/null)
+
 # build html documents
-jupyter-book build /Users/ethan/Documents/GitHub/pythonbook/Chapters/ --path-output /Users/ethan/Documents/GitHub/pythonbook/Book --config /Users/ethan/Documents/GitHub/pythonbook/yaml/_config.yml --toc /Users/ethan/Documents/GitHub/pythonbook/yaml/_toc.yml
+mkdir -p $BUILD
+STAMP=$BUILD/.build_started
+touch $STAMP
+jupyter-book build $ROOT/Chapters/ --path-output $ROOT/Book --config $ROOT/yaml/_config.yml --toc $ROOT/yaml/_toc.yml || exit 1
+touch -r $STAMP $LSP_STAMP
+
+# report which pages were actually regenerated
+echo "Pages regenerated:"
+find $BUILD/html -maxdepth 1 -name '*.html' -newer $STAMP | sort
+rm $STAMP
 
 # push to GitHub
 
@@ -2,61 +2,272 @@
 # coding: utf-8
 
 import os
+import sys
+import json
+import time
 import argparse
 import glob
+import hashlib
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import nbformat
 from nbconvert.preprocessors import ExecutePreprocessor
 from nbconvert.preprocessors.execute import CellExecutionError
 
-# Parse args
-parser = argparse.ArgumentParser(description="Runs a set of Jupyter \
-                                              notebooks.")
-file_text = """ Notebook file(s) to be run, e.g. '*.ipynb' (default),
-'my_nb1.ipynb', 'my_nb1.ipynb my_nb2.ipynb', 'my_dir/*.ipynb'
-"""
-parser.add_argument('file_list', metavar='F', type=str, nargs='*', 
-    help=file_text)
-parser.add_argument('-t', '--timeout', help='Length of time (in secs) a cell \
-    can run before raising TimeoutError (default 600).', default=600, 
-    required=False)
-parser.add_argument('-p', '--run-path', help='The path the notebook will be \
-    run from (default pwd).', default='.', required=False)
-args = parser.parse_args()
-print('Args:', args)
-if not args.file_list: # Default file_list
-    args.file_list = glob.glob('*.ipynb')
-
-# Check list of notebooks
-notebooks = []
-print('Notebooks to run:')
-for f in args.file_list:
-    # Find notebooks but not notebooks previously output from this script
-    if f.endswith('.ipynb') and not f.endswith('_out.ipynb'):
-        print(f[:-6])
-        notebooks.append(f[:-6]) # Want the filename without '.ipynb'
-
-# Execute notebooks and output
-num_notebooks = len(notebooks)
-print('*****')
-for i, n in enumerate(notebooks):
+KERNEL_NAME = 'python3'
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Data')
+LIB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Chapters',
+                       'lsp')
+LIB_IMPORT = re.compile(r'\b(?:from|import)\s+lsp\.(\w+)')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Runs a set of Jupyter \
+                                                  notebooks.")
+    file_text = """ Notebook file(s) to be run, e.g. '*.ipynb' (default),
+    'my_nb1.ipynb', 'my_nb1.ipynb my_nb2.ipynb', 'my_dir/*.ipynb'
+    """
+    parser.add_argument('file_list', metavar='F', type=str, nargs='*',
+        help=file_text)
+    parser.add_argument('-t', '--timeout', help='Length of time (in secs) a cell \
+        can run before raising TimeoutError (default 600).', default=600,
+        required=False)
+    parser.add_argument('-p', '--run-path', help='The path the notebook will be \
+        run from (default pwd).', default='.', required=False)
+    parser.add_argument('-j', '--jobs', help='Number of notebooks to run at \
+        once, each in its own kernel (default 1).', default=1, type=int,
+        required=False)
+    parser.add_argument('--timings', help='JSON file used to remember how long \
+        each notebook took, so that the slowest ones can be started first \
+        (default .notebook_timings.json).', default='.notebook_timings.json',
+        required=False)
+    parser.add_argument('-c', '--cache-dir', help='Directory where executed \
+        notebooks are cached. Notebooks whose code, data files and lsp \
+        modules have not changed are restored from here instead of being run \
+        (default .nbcache).', default='.nbcache', required=False)
+    parser.add_argument('--no-cache', help='Run every notebook, ignoring and \
+        not updating the cache.', action='store_true')
+    parser.add_argument('-d', '--data-dir', help='Directory holding the data \
+        files read by the notebooks (default Data next to this script).',
+        default=DATA_DIR, required=False)
+    parser.add_argument('-l', '--lib-dir', help='Directory of the lsp \
+        package imported by the notebooks (default Chapters/lsp next to this \
+        script).', default=LIB_DIR, required=False)
+    return parser.parse_args()
+
+
+def find_notebooks(file_list):
+    notebooks = []
+    print('Notebooks to run:')
+    for f in file_list:
+        # Find notebooks but not notebooks previously output from this script
+        if f.endswith('.ipynb') and not f.endswith('_out.ipynb'):
+            print(f[:-6])
+            notebooks.append(f[:-6]) # Want the filename without '.ipynb'
+    return notebooks
+
+
+def load_timings(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_timings(path, timings):
+    with open(path, mode='wt') as f:
+        json.dump(timings, f, indent=1, sort_keys=True)
+
+
+def normalize_source(source):
+    # Trailing whitespace and blank lines at the ends of a cell cannot change
+    # what the code does, so they should not invalidate the cache
+    lines = [line.rstrip() for line in source.splitlines()]
+    return '\n'.join(lines).strip('\n')
+
+
+def lib_modules(code, lib_dir):
+    """The modules of `lib_dir` that `code` imports, directly or through
+    other modules of `lib_dir`, with the package's __init__.py."""
+    modules = set()
+    pending = LIB_IMPORT.findall(code)
+    while pending:
+        name = pending.pop()
+        path = os.path.join(lib_dir, name + '.py')
+        if name in modules or not os.path.exists(path):
+            continue
+        modules.add(name)
+        with open(path) as f:
+            pending.extend(LIB_IMPORT.findall(f.read()))
+    if modules:
+        modules.add('__init__')
+    return sorted(modules)
+
+
+def cache_key(nb, data_dir, lib_dir=None):
+    """Hash everything that can change the outputs of a notebook.
+
+    That is the source of its code cells, the kernel it runs in, the
+    contents of every file in `data_dir` that the code mentions, either by
+    file name or, as in ``load('zeppo')``, by quoted name without extension,
+    and the source of the modules of `lib_dir` that it imports.
+    """
+    h = hashlib.sha256()
+    h.update(KERNEL_NAME.encode())
+    code = [normalize_source(c.source) for c in nb.cells
+            if c.cell_type == 'code']
+    for source in code:
+        h.update(b'\0' + source.encode())
+    code = '\n'.join(code)
+    if data_dir and os.path.isdir(data_dir):
+        for name in sorted(os.listdir(data_dir)):
+            stem = re.escape(os.path.splitext(name)[0])
+            if name in code or re.search(r'[\'"]%s[\'"]' % stem, code):
+                with open(os.path.join(data_dir, name), 'rb') as f:
+                    h.update(b'\0' + name.encode() + b'\0')
+                    h.update(hashlib.sha256(f.read()).digest())
+    if lib_dir and os.path.isdir(lib_dir):
+        for name in lib_modules(code, lib_dir):
+            with open(os.path.join(lib_dir, name + '.py'), 'rb') as f:
+                h.update(b'\0lsp.' + name.encode() + b'\0')
+                h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+
+def restore_outputs(nb, cached):
+    # The code cells are identical (that is what the key says), so the
+    # executed copy can be matched up with the current one cell by cell. The
+    # markdown cells are taken from the current notebook.
+    code = [c for c in nb.cells if c.cell_type == 'code']
+    cached_code = [c for c in cached.cells if c.cell_type == 'code']
+    for cell, cached_cell in zip(code, cached_code):
+        cell.outputs = cached_cell.outputs
+        cell.execution_count = cached_cell.execution_count
+
+
+def run_notebook(n, timeout, run_path, cache_dir=None, data_dir=None,
+                 lib_dir=None):
+    """Execute notebook `n` and write the result to `n`_out.ipynb.
+
+    If `cache_dir` holds an executed copy of the notebook with the same cache
+    key, its outputs are restored instead of running the notebook.
+
+    Returns a (notebook, status, seconds) tuple, where status is one of
+    'ok', 'cached', 'error' or 'timeout'.
+    """
     n_out = n + '_out'
+    status = 'ok'
+    start = time.time()
     with open(n + '.ipynb') as f:
         nb = nbformat.read(f, as_version=4)
-        ep = ExecutePreprocessor(timeout=int(args.timeout), kernel_name='python3')
-        try:
-            print('Running', n, ':', i, '/', num_notebooks)
-            out = ep.preprocess(nb, {'metadata': {'path': args.run_path}})
-        except CellExecutionError:
-            out = None
-            msg = 'Error executing the notebook "%s".\n' % n
-            msg += 'See notebook "%s" for the traceback.' % n_out
-            print(msg)
-        except TimeoutError:
-            msg = 'Timeout executing the notebook "%s".\n' % n
-            print(msg)
-        finally:
-            # Write output file
+
+    if cache_dir:
+        cached_nb = os.path.join(cache_dir, cache_key(nb, data_dir, lib_dir)
+                                 + '.ipynb')
+        if os.path.exists(cached_nb):
+            with open(cached_nb) as f:
+                restore_outputs(nb, nbformat.read(f, as_version=4))
             with open(n_out + '.ipynb', mode='wt') as f:
                 nbformat.write(nb, f)
-                
\ No newline at end of file
+            return n, 'cached', time.time() - start
+
+    ep = ExecutePreprocessor(timeout=int(timeout), kernel_name=KERNEL_NAME)
+    try:
+        out = ep.preprocess(nb, {'metadata': {'path': run_path}})
+    except CellExecutionError:
+        out = None
+        status = 'error'
+        msg = 'Error executing the notebook "%s".\n' % n
+        msg += 'See notebook "%s" for the traceback.' % n_out
+        print(msg)
+    except TimeoutError:
+        status = 'timeout'
+        msg = 'Timeout executing the notebook "%s".\n' % n
+        print(msg)
+    finally:
+        # Write output file
+        with open(n_out + '.ipynb', mode='wt') as f:
+            nbformat.write(nb, f)
+    if cache_dir and status == 'ok':
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cached_nb, mode='wt') as f:
+            nbformat.write(nb, f)
+    return n, status, time.time() - start
+
+
+def run_serial(notebooks, args):
+    results = []
+    num_notebooks = len(notebooks)
+    for i, n in enumerate(notebooks):
+        print('Running', n, ':', i, '/', num_notebooks)
+        results.append(run_notebook(n, args.timeout, args.run_path,
+                                    args.cache_dir, args.data_dir,
+                                    args.lib_dir))
+    return results
+
+
+def run_parallel(notebooks, args, timings):
+    # Start the notebooks that took longest last time first, so that one slow
+    # chapter does not end up running on its own at the end. Notebooks we
+    # have never timed are assumed to be slow.
+    notebooks = sorted(notebooks, key=lambda n: timings.get(n, float('inf')),
+                       reverse=True)
+    results = []
+    num_notebooks = len(notebooks)
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {pool.submit(run_notebook, n, args.timeout, args.run_path,
+                               args.cache_dir, args.data_dir,
+                               args.lib_dir): n
+                   for n in notebooks}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = (futures[future], 'error', 0.0)
+                print('Worker failed on "%s": %s' % (futures[future], e))
+            results.append(result)
+            print('Finished', result[0], '(%s, %.1fs) :' % result[1:],
+                  len(results), '/', num_notebooks)
+    return results
+
+
+def report(results):
+    print('*****')
+    failed = [r for r in results if r[1] not in ('ok', 'cached')]
+    for n, status, seconds in sorted(results):
+        print('%-8s %7.1fs  %s' % (status, seconds, n))
+    print('%d passed, %d failed' % (len(results) - len(failed), len(failed)))
+    return failed
+
+
+def main():
+    args = parse_args()
+    print('Args:', args)
+    if not args.file_list: # Default file_list
+        args.file_list = glob.glob('*.ipynb')
+
+    # Check list of notebooks
+    notebooks = find_notebooks(args.file_list)
+
+    # Execute notebooks and output
+    if args.no_cache:
+        args.cache_dir = None
+    timings = load_timings(args.timings)
+    print('*****')
+    if args.jobs > 1:
+        results = run_parallel(notebooks, args, timings)
+    else:
+        results = run_serial(notebooks, args)
+
+    for n, status, seconds in results:
+        if status == 'ok':
+            timings[n] = round(seconds, 2)
+    save_timings(args.timings, timings)
+
+    failed = report(results)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()